@@ -0,0 +1,206 @@
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from Relation import Relation
+from Split import root_box
+from Oracles import count_oracle
+from AliasTable import AliasTable
+from LRUCache import LRUCache
+
+# AcyclicPlan per (relations, box_attributes, predicates), or None for
+# cyclic queries, so Sample.sample only runs the GYO reduction once. Each
+# built plan holds a copy of the rows in its root box, hence the small bound.
+acyclic_plans = LRUCache(maxsize=1 << 3)
+
+
+def join_tree(Q: List[Relation]) -> Optional[Tuple[List[int], List[Optional[int]]]]:
+    """GYO reduction of Q's hypergraph.
+
+    Repeatedly removes an ear: a relation whose attributes shared with the
+    remaining relations are all contained in one of them, which becomes its
+    parent. Returns (order, parent), with every relation listed after its
+    children and the root last, or None if Q is cyclic.
+    """
+    attributes = [set(relation.attributes) for relation in Q]
+    remaining = list(range(len(Q)))
+    parent = [None] * len(Q)
+    order = []
+    while len(remaining) > 1:
+        for e in remaining:
+            others = [f for f in remaining if f != e]
+            shared = attributes[e] & set().union(*(attributes[f] for f in others))
+            witness = next((f for f in others if shared <= attributes[f]), None)
+            if witness is not None:
+                parent[e] = witness
+                order.append(e)
+                remaining.remove(e)
+                break
+        else:
+            return None
+    order.extend(remaining)
+    return order, parent
+
+
+class AcyclicSampler:
+    """Exact-weight uniform sampler for acyclic joins.
+
+    Along a join tree from ``join_tree`` every tuple is weighted, bottom up,
+    by the number of join tuples it extends to in its subtree: the product
+    over its children of the total weight of the child tuples that agree
+    with it on their shared attributes. A sample picks a root tuple in
+    proportion to its weight and then, top down, one matching tuple per
+    child in proportion to theirs, so every trial succeeds and costs one
+    alias table draw per relation. The weights take one pass over the data
+    (the grouping is a sort); the alias table of a group of child tuples is
+    built the first time it is drawn from. Any relation update rebuilds the
+    weights on the next draw.
+    """
+
+    def __init__(self, Q: List[Relation], box_attributes: List[str],
+                 predicates: Optional[Dict[str, Tuple[int, int]]] = None):
+        tree = join_tree(Q)
+        if tree is None:
+            raise ValueError("Q is cyclic")
+        self.order, self.parent = tree
+        self.Q = Q
+        self.box_attributes = box_attributes
+        self.predicates = predicates
+        self.build()
+
+    def build(self):
+        self._versions = [relation.version for relation in self.Q]
+        B = root_box(self.Q, self.box_attributes, self.predicates)
+        # Rows of every relation inside B, as (rows x attributes) arrays
+        # reported by the range trees, so the cost follows the rows selected.
+        self.rows = [relation.box_rows(B, self.box_attributes) for relation in self.Q]
+        self.weights = [np.ones(len(rows)) for rows in self.rows]
+        # For every child e: the group of e's rows each parent row matches
+        # (parent_group[e]), e's rows sorted by group (group_rows[e]) and
+        # where each group starts in that order (group_starts[e]).
+        self.parent_group = [None] * len(self.Q)
+        self.group_rows = [None] * len(self.Q)
+        self.group_starts = [None] * len(self.Q)
+        self.children = [[] for _ in self.Q]
+        self._alias = {}
+
+        for e in self.order[:-1]:
+            p = self.parent[e]
+            self.children[p].append(e)
+            shared = [attr for attr in self.Q[e].attributes if attr in self.Q[p].attributes]
+            child_keys = self.rows[e][:, [self.Q[e].attributes.index(attr) for attr in shared]]
+            parent_keys = self.rows[p][:, [self.Q[p].attributes.index(attr) for attr in shared]]
+            keys = np.concatenate([child_keys, parent_keys])
+            if shared:
+                _, groups = np.unique(keys, axis=0, return_inverse=True)
+                groups = groups.reshape(-1)
+            else:
+                groups = np.zeros(len(keys), dtype=np.int64)
+            child_groups, parent_groups = groups[:len(child_keys)], groups[len(child_keys):]
+            group_weights = np.bincount(child_groups, weights=self.weights[e],
+                                        minlength=len(keys))
+            self.weights[p] = self.weights[p] * group_weights[parent_groups]
+            self.parent_group[e] = parent_groups
+            self.group_rows[e] = np.argsort(child_groups, kind="stable")
+            self.group_starts[e] = np.searchsorted(child_groups[self.group_rows[e]],
+                                                   np.arange(len(keys) + 1))
+
+        root = self.order[-1]
+        self.root = root
+        self.size = int(round(self.weights[root].sum()))
+        self._root_alias = AliasTable(self.weights[root].tolist()) if self.size else None
+
+    def _draw(self, e: int, group: int, rng: random.Random) -> int:
+        # Row of child e drawn from the given group in proportion to weight.
+        alias = self._alias.get((e, group))
+        if alias is None:
+            start, end = self.group_starts[e][group], self.group_starts[e][group + 1]
+            rows = self.group_rows[e][start:end]
+            alias = (rows, AliasTable(self.weights[e][rows].tolist()))
+            self._alias[(e, group)] = alias
+        rows, table = alias
+        return int(rows[table.sample(rng)])
+
+    def sample(self, rng: random.Random = random) -> Optional[Tuple[int]]:
+        # A uniform join tuple in box_attributes order, or None if the join
+        # is empty.
+        if self._versions != [relation.version for relation in self.Q]:
+            self.build()
+        if not self.size:
+            return None
+        values = {}
+        stack = [(self.root, self._root_alias.sample(rng))]
+        while stack:
+            e, row = stack.pop()
+            values.update(zip(self.Q[e].attributes, self.rows[e][row].tolist()))
+            for child in self.children[e]:
+                stack.append((child, self._draw(child, int(self.parent_group[child][row]), rng)))
+        return tuple(values[attr] for attr in self.box_attributes)
+
+    def sample_many(self, k: int, rng: random.Random = random) -> Tuple[np.ndarray, int]:
+        # Same result convention as Sample.sample_many; no trial fails unless
+        # the join is empty.
+        samples = [self.sample(rng) for _ in range(k)]
+        return np.array([s for s in samples if s is not None],
+                        dtype=np.int64).reshape(-1, len(self.box_attributes)), k
+
+
+class AcyclicPlan:
+    """Decides when the trials of an acyclic join are worth an AcyclicSampler.
+
+    Building an AcyclicSampler, and rebuilding it after any update, costs a
+    pass over the rows of the root box. The AGM sampler needs no build and
+    follows updates incrementally, but its trials are slower and can fail.
+    As in ski rental, trials are served by the AGM sampler and the time
+    they take is charged to the plan until it adds up to the estimated
+    build time. Only then is the exact sampler built. A join that is
+    sampled rarely, updated often or restricted to a few rows by predicates
+    therefore never costs more than twice what the AGM sampler alone would,
+    and one that is sampled a lot ends up on the exact sampler.
+    """
+
+    # Build time per row before the first build has been measured.
+    default_seconds_per_row = 2e-6
+
+    def __init__(self, Q: List[Relation], box_attributes: List[str],
+                 predicates: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.Q = Q
+        self.box_attributes = box_attributes
+        self.predicates = predicates
+        self.exact = None
+        self.charged = 0.0
+        self.seconds_per_row = self.default_seconds_per_row
+
+    def sampler(self) -> Optional[AcyclicSampler]:
+        """The up to date exact sampler, or None while the AGM sampler should serve."""
+        versions = [relation.version for relation in self.Q]
+        if self.exact is not None:
+            if self.exact._versions == versions:
+                return self.exact
+            self.exact = None  # Stale: free its rows, rebuild once paid for
+            self.charged = 0.0
+        B = root_box(self.Q, self.box_attributes, self.predicates)
+        rows = sum(count_oracle(relation, B, self.box_attributes) for relation in self.Q)
+        if self.charged < rows * self.seconds_per_row:
+            return None
+        start = time.perf_counter()
+        self.exact = AcyclicSampler(self.Q, self.box_attributes, self.predicates)
+        if rows:
+            self.seconds_per_row = (time.perf_counter() - start) / rows
+        return self.exact
+
+    def charge(self, seconds: float):
+        # Time the AGM sampler spent on trials this plan could have served.
+        self.charged += seconds
+
+
+def acyclic_plan(Q: List[Relation], box_attributes: List[str],
+                 predicates: Optional[Dict[str, Tuple[int, int]]] = None) -> Optional[AcyclicPlan]:
+    """Cached AcyclicPlan for Q and predicates, or None if Q is cyclic."""
+    key = (tuple(relation.cache_key for relation in Q), tuple(box_attributes),
+           tuple(sorted((attr, tuple(interval)) for attr, interval in (predicates or {}).items())))
+    if key in acyclic_plans:
+        return acyclic_plans.get(key)
+    plan = AcyclicPlan(Q, box_attributes, predicates) if join_tree(Q) is not None else None
+    acyclic_plans.put(key, plan)
+    return plan
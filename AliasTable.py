@@ -0,0 +1,42 @@
+import random
+from typing import List
+
+
+class AliasTable:
+    """Walker's alias table for O(1) draws from a fixed discrete distribution.
+
+    Built with Vose's method in O(n) from non-negative weights that need not
+    sum to one. ``sample`` returns an index with probability proportional to
+    its weight.
+    """
+
+    def __init__(self, weights: List[float]):
+        n = len(weights)
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            raise ValueError("weights must have a positive sum")
+        self.n = n
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        scaled = [weight * n / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Whatever is left is full up to floating point error.
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng: random.Random = random) -> int:
+        u = rng.random() * self.n
+        i = min(int(u), self.n - 1)
+        return i if u - i < self.prob[i] else self.alias[i]
@@ -0,0 +1,100 @@
+import math
+from typing import List, Tuple
+from Relation import Relation
+from LRUCache import LRUCache
+
+# Optimal covers keyed by (relation cache_keys, box_attributes), stored with
+# the relation sizes they were solved for.
+cover_cache = LRUCache(maxsize=1 << 10)
+
+
+def solve_packing_lp(A: List[List[float]], c: List[float]) -> Tuple[List[float], List[float]]:
+    """Maximize sum(y) subject to A^T y <= c, y >= 0, with c >= 0.
+
+    A has one row per attribute and one column per relation. The origin is
+    feasible, so a single-phase tableau simplex (Bland's rule, no cycling)
+    suffices. Returns (y, w) where w are the shadow prices of the relation
+    constraints, i.e. an optimal solution of the dual covering LP
+    min c^T w subject to A w >= 1, w >= 0.
+    """
+    m, n = len(A), len(c)
+    # Rows are the n relation constraints over the m attribute variables and
+    # n slacks; the last row is the negated objective.
+    rows = [[A[a][e] for a in range(m)] + [1.0 if k == e else 0.0 for k in range(n)] + [c[e]]
+            for e in range(n)]
+    objective = [-1.0] * m + [0.0] * n + [0.0]
+    basis = [m + e for e in range(n)]
+    eps = 1e-12
+
+    while True:
+        entering = next((j for j in range(m + n) if objective[j] < -eps), None)
+        if entering is None:
+            break
+        ratios = [(row[-1] / row[entering], basis[r], r)
+                  for r, row in enumerate(rows) if row[entering] > eps]
+        if not ratios:
+            raise ValueError("Fractional edge cover LP is unbounded: "
+                             "some attribute is not covered by any relation")
+        _, _, pivot = min(ratios)
+        pivot_row = rows[pivot]
+        scale = pivot_row[entering]
+        pivot_row[:] = [value / scale for value in pivot_row]
+        for row in rows + [objective]:
+            if row is not pivot_row and abs(row[entering]) > eps:
+                factor = row[entering]
+                row[:] = [value - factor * pivot_value
+                          for value, pivot_value in zip(row, pivot_row)]
+        basis[pivot] = entering
+
+    y = [0.0] * m
+    for r, j in enumerate(basis):
+        if j < m:
+            y[j] = rows[r][-1]
+    w = [max(objective[m + e], 0.0) for e in range(n)]
+    return y, w
+
+
+def check_edge_cover(Q: List[Relation], box_attributes: List[str], W: List[float]):
+    """Raise ValueError unless W is a fractional edge cover of Q.
+
+    W needs one non-negative weight per relation, and every attribute of
+    box_attributes must be covered with total weight at least 1; otherwise
+    AGM_W is not an upper bound and the samples are biased.
+    """
+    if len(W) != len(Q):
+        raise ValueError(f"W has {len(W)} weights for {len(Q)} relations")
+    if any(w_e < 0 for w_e in W):
+        raise ValueError(f"W has negative weights: {list(W)}")
+    for attr in box_attributes:
+        weight = sum(w_e for relation, w_e in zip(Q, W) if attr in relation.attributes)
+        if weight < 1 - 1e-9:
+            raise ValueError(f"W covers attribute {attr} with total weight {weight} < 1")
+
+
+def optimal_edge_cover(Q: List[Relation], box_attributes: List[str]) -> List[float]:
+    """Fractional edge cover of Q's hypergraph minimizing the AGM bound.
+
+    Solves min sum_e w_e log|R_e| subject to every attribute of
+    box_attributes being covered with total weight at least 1. Relations
+    with at most one tuple cost nothing, so they absorb as much of the cover
+    as they can. The cover is re-solved only when relation sizes drift by
+    more than a factor of two.
+    """
+    key = (tuple(relation.cache_key for relation in Q), tuple(box_attributes))
+    sizes = [max(len(relation), 1) for relation in Q]
+    entry = cover_cache.get(key)
+    if entry is not None:
+        # Any cover gives a valid bound, so a cover is kept (and the AGM
+        # values cached for it stay usable) until some relation has grown
+        # or shrunk by more than a factor of two.
+        cached_sizes, W = entry
+        if all(size <= 2 * cached and cached <= 2 * size
+               for size, cached in zip(sizes, cached_sizes)):
+            return W
+
+    A = [[1.0 if attr in relation.attributes else 0.0 for relation in Q]
+         for attr in box_attributes]
+    c = [math.log(size) for size in sizes]
+    _, W = solve_packing_lp(A, c)
+    cover_cache.put(key, (sizes, W))
+    return W
@@ -0,0 +1,79 @@
+import bisect
+from typing import Any, Dict, Hashable, List, Tuple
+import numpy as np
+from Relation import Relation
+
+
+class Encoding:
+    """Order-preserving dictionary encoding of attribute values into ranks.
+
+    Values of every attribute name are collected across all relations with
+    ``add``, then each attribute gets one sorted dictionary that maps its
+    distinct values to the dense ranks 0..n-1, shared by every relation
+    with that attribute. Values only need to be hashable and mutually
+    comparable, so sparse 64-bit ids and strings both work. Relations built
+    with ``relation`` live in rank space, where box widths are bounded by
+    the distinct counts; ``decode`` maps sampled tuples back.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, set] = {}
+        self.values: Dict[str, List[Any]] = {}
+        self.codes: Dict[str, Dict[Hashable, int]] = {}
+
+    def add(self, attributes: List[str], tuples: List[Tuple]):
+        if self.values:
+            raise ValueError("Encoding is already frozen, add every relation first")
+        for k, attr in enumerate(attributes):
+            self._pending.setdefault(attr, set()).update(tuple_[k] for tuple_ in tuples)
+
+    def _freeze(self):
+        if self.values or not self._pending:
+            return
+        for attr, values in self._pending.items():
+            self.values[attr] = sorted(values)
+            self.codes[attr] = {value: rank for rank, value in enumerate(self.values[attr])}
+        self._pending = {}
+
+    def relation(self, name: str, attributes: List[str], tuples: List[Tuple]) -> Relation:
+        """Build a columnar relation of ranks from raw tuples added before."""
+        self._freeze()
+        columns = {}
+        for k, attr in enumerate(attributes):
+            codes = self.codes[attr]
+            columns[attr] = np.fromiter((codes[tuple_[k]] for tuple_ in tuples),
+                                        dtype=np.int64, count=len(tuples))
+        return Relation.from_columns(name, attributes, columns)
+
+    def encode_value(self, attr: str, value: Any) -> int:
+        self._freeze()
+        return self.codes[attr][value]
+
+    def encode_interval(self, attr: str, low: Any, high: Any) -> Tuple[int, int]:
+        # Rank interval of the encoded values v with low <= v <= high; empty
+        # (low rank > high rank) if there are none.
+        self._freeze()
+        values = self.values[attr]
+        return bisect.bisect_left(values, low), bisect.bisect_right(values, high) - 1
+
+    def encode_predicates(self, predicates: Dict[str, Tuple[Any, Any]]) -> Dict[str, Tuple[int, int]]:
+        # Range predicates on original values as predicates on their ranks,
+        # for the predicates argument of the samplers.
+        return {attr: self.encode_interval(attr, low, high) for attr, (low, high) in predicates.items()}
+
+    def decode(self, tuple_: Tuple[int], box_attributes: List[str]) -> Tuple:
+        return tuple(self.values[attr][rank] for attr, rank in zip(box_attributes, tuple_))
+
+    def decode_samples(self, samples: np.ndarray, box_attributes: List[str]) -> List[Tuple]:
+        # Decode the rows of a sample_many result.
+        return [self.decode(row, box_attributes) for row in samples.tolist()]
+
+
+def encode_relations(relations: List[Tuple[str, List[str], List[Tuple]]]) -> \
+        Tuple[List[Relation], Encoding]:
+    """Encode (name, attributes, tuples) triples with one shared Encoding."""
+    encoding = Encoding()
+    for _, attributes, tuples in relations:
+        encoding.add(attributes, tuples)
+    return [encoding.relation(name, attributes, tuples)
+            for name, attributes, tuples in relations], encoding
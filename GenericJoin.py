@@ -0,0 +1,94 @@
+from typing import Dict, Iterator, List, Tuple
+from Relation import Relation
+
+
+class JoinPlan:
+    """Tries of every relation of Q laid out along one global attribute order.
+
+    ``levels[i]`` lists the relations that contain ``attribute_order[i]``, so
+    Generic Join knows which trie nodes to intersect at each depth.
+    """
+
+    def __init__(self, Q: List[Relation], attribute_order: List[str]):
+        self.attribute_order = attribute_order
+        self.tries = [relation.trie(attribute_order) for relation in Q]
+        self.levels = [[k for k, relation in enumerate(Q) if attr in relation.attributes]
+                       for attr in attribute_order]
+        for attr, level in zip(attribute_order, self.levels):
+            if not level:
+                raise ValueError(f"Attribute {attr} does not occur in any relation")
+
+
+def _candidates(nodes: List[Dict], level: List[int]) -> Iterator[int]:
+    # Iterate the smallest trie node and probe the others, so every level
+    # costs at most the smallest fan-out (the Generic Join intersection).
+    smallest = min(level, key=lambda k: len(nodes[k]))
+    others = [nodes[k] for k in level if k != smallest]
+    for value in sorted(nodes[smallest]):
+        if all(value in node for node in others):
+            yield value
+
+
+def _descend(nodes: List[Dict], level: List[int], value: int) -> List[Dict]:
+    children = list(nodes)
+    for k in level:
+        children[k] = nodes[k][value]
+    return children
+
+
+def generic_join(Q: List[Relation], attribute_order: List[str]) -> Iterator[Tuple[int]]:
+    """Yield the tuples of the natural join of Q in attribute_order.
+
+    Worst-case optimal Generic Join: attributes are bound one at a time by
+    intersecting the matching trie levels of the relations that contain
+    them, so the running time is within the AGM bound of the query for any
+    number of relations. Duplicate input tuples are kept (bag semantics).
+    Output is produced in lexicographic order of attribute_order.
+    """
+    plan = JoinPlan(Q, attribute_order)
+    depth = len(attribute_order)
+    prefix = []
+
+    def expand(nodes: List[Dict], i: int) -> Iterator[Tuple[int]]:
+        if i == depth:
+            multiplicity = 1
+            for node in nodes:
+                multiplicity *= node
+            for _ in range(multiplicity):
+                yield tuple(prefix)
+            return
+        level = plan.levels[i]
+        for value in _candidates(nodes, level):
+            prefix.append(value)
+            yield from expand(_descend(nodes, level, value), i + 1)
+            prefix.pop()
+
+    yield from expand(plan.tries, 0)
+
+
+def join_count(Q: List[Relation], attribute_order: List[str]) -> int:
+    """Return |join of Q| without materializing any output tuple.
+
+    Same descent as ``generic_join``, but the last level only sums the leaf
+    multiplicities of the intersection.
+    """
+    plan = JoinPlan(Q, attribute_order)
+    depth = len(attribute_order)
+
+    def count(nodes: List[Dict], i: int) -> int:
+        level = plan.levels[i]
+        total = 0
+        if i == depth - 1:
+            for value in _candidates(nodes, level):
+                multiplicity = 1
+                for k, node in enumerate(nodes):
+                    multiplicity *= node[value] if k in level else node
+                total += multiplicity
+            return total
+        for value in _candidates(nodes, level):
+            total += count(_descend(nodes, level, value), i + 1)
+        return total
+
+    if depth == 0:
+        return 0
+    return count(plan.tries, 0)
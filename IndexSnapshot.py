@@ -0,0 +1,68 @@
+import pickle
+from typing import Dict, List, Optional, Tuple
+from Relation import Relation
+from PreparedSampler import PreparedSampler
+
+# Bumped whenever the pickled index classes change shape.
+SNAPSHOT_FORMAT = 4
+
+
+def _predicates(sampler: PreparedSampler) -> Dict[str, Tuple[int, int]]:
+    return {attr: tuple(interval) for attr, interval in (sampler.predicates or {}).items()}
+
+
+def save_indexes(path: str, Q: List[Relation], sampler: Optional[PreparedSampler] = None):
+    """Write the indexes built for Q (and sampler's split tree) to path.
+
+    Every relation's entry is stored with its data fingerprint, so
+    ``load_indexes`` can tell whether it still matches the data.
+    """
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "relations": [{"name": relation.name, "fingerprint": relation.fingerprint(),
+                       "indexes": relation.index_state()} for relation in Q],
+        "sampler": None,
+    }
+    if sampler is not None:
+        snapshot["sampler"] = {"box_attributes": sampler.box_attributes, "W": sampler.W,
+                               "predicates": _predicates(sampler), "order": sampler.order,
+                               "root": sampler.root, "node_count": sampler.node_count}
+    with open(path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_indexes(path: str, Q: List[Relation], sampler: Optional[PreparedSampler] = None) -> bool:
+    """Install the indexes saved in path into Q (and sampler).
+
+    A relation only gets the indexes saved for a relation with the same
+    name and fingerprint; the others keep building theirs lazily. The split
+    tree is only restored when every relation of Q matched and the sampler
+    has the same box_attributes, predicates and split order. Returns
+    whether everything was restored.
+    """
+    with open(path, "rb") as f:
+        snapshot = pickle.load(f)
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        return False
+
+    saved = {entry["name"]: entry for entry in snapshot["relations"]}
+    matched = 0
+    for relation in Q:
+        entry = saved.get(relation.name)
+        if entry is not None and entry["fingerprint"] == relation.fingerprint():
+            relation.restore_index_state(entry["indexes"])
+            matched += 1
+    complete = matched == len(Q) == len(saved)
+
+    state = snapshot["sampler"]
+    if sampler is None:
+        return complete
+    if not complete or state is None or state["box_attributes"] != sampler.box_attributes or \
+            state["predicates"] != _predicates(sampler) or state["order"] != sampler.order or \
+            (sampler.weights is not None and state["W"] != sampler.weights):
+        return False
+    sampler.W = state["W"]
+    sampler.root = state["root"]
+    sampler.node_count = state["node_count"]
+    sampler._versions = [relation.version for relation in sampler.Q]
+    return True
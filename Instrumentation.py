@@ -0,0 +1,94 @@
+import functools
+import math
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# The SamplerStats being filled in, or None when instrumentation is off.
+active: Optional['SamplerStats'] = None
+
+
+class SamplerStats:
+    """Counters filled in by the oracles, split and the samplers while active.
+
+    ``calls`` and ``seconds`` are per instrumented function; times are
+    inclusive, so ``split`` includes the ``agm_bound`` calls it makes.
+    ``depths`` is a histogram of the number of splits per descent,
+    ``box_sizes`` a histogram of floor(log2(volume)) of the visited boxes,
+    and ``outcomes`` counts trials by how they ended: ``success``,
+    ``nil_child``, ``empty_leaf`` or ``coin_toss``.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        self.depths = Counter()
+        self.box_sizes = Counter()
+        self.outcomes = Counter()
+        self._running = set()
+
+    def visit(self, box: List[Tuple[int, int]]):
+        volume = 1
+        for low, high in box:
+            volume *= max(high - low + 1, 0)
+        self.box_sizes[int(math.log2(volume)) if volume else -1] += 1
+
+    def end_descent(self, depth: int, outcome: str, trials: int = 1):
+        self.depths[depth] += trials
+        self.outcomes[outcome] += trials
+
+    def as_dict(self) -> Dict:
+        return {"calls": dict(self.calls), "seconds": dict(self.seconds),
+                "depths": dict(sorted(self.depths.items())),
+                "box_sizes": dict(sorted(self.box_sizes.items())),
+                "outcomes": dict(self.outcomes)}
+
+
+def instrumented(function: Callable) -> Callable:
+    """Count and time calls of function while stats are collected.
+
+    When instrumentation is off the wrapper only checks ``active``.
+    Recursive calls are counted but not timed again.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        stats = active
+        if stats is None:
+            return function(*args, **kwargs)
+        stats.calls[name] += 1
+        if name in stats._running:
+            return function(*args, **kwargs)
+        stats._running.add(name)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.seconds[name] += time.perf_counter() - start
+            stats._running.discard(name)
+
+    return wrapper
+
+
+def enable_stats() -> SamplerStats:
+    global active
+    active = SamplerStats()
+    return active
+
+
+def disable_stats() -> Optional[SamplerStats]:
+    global active
+    stats, active = active, None
+    return stats
+
+
+@contextmanager
+def collect_stats() -> Iterator[SamplerStats]:
+    """Collect stats for the duration of a with block."""
+    stats = enable_stats()
+    try:
+        yield stats
+    finally:
+        disable_stats()
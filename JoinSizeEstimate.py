@@ -0,0 +1,85 @@
+import math
+import random
+import time
+from statistics import NormalDist
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from Relation import Relation
+from PreparedSampler import PreparedSampler
+
+
+class JoinSizeEstimate(NamedTuple):
+    estimate: float
+    low: float
+    high: float
+    trials: int
+    successes: int
+    agm: float
+    stopped_by: str  # "relative_error", "max_trials", "time_limit" or "empty"
+
+
+def wilson_interval(successes: int, trials: int, z: float) -> Tuple[float, float]:
+    # Wilson score interval of a binomial proportion; unlike the normal
+    # approximation it stays inside [0, 1] and is usable with few successes.
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half_width = z / denominator * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials))
+    return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+
+def estimate_join_size(Q: List[Relation], box_attributes: List[str], W: Optional[List[float]] = None,
+                       relative_error: float = 0.05, confidence: float = 0.95,
+                       max_trials: Optional[int] = None, time_limit: Optional[float] = None,
+                       seed: Optional[int] = None,
+                       sampler: Optional[PreparedSampler] = None,
+                       predicates: Optional[Dict[str, Tuple[int, int]]] = None) -> JoinSizeEstimate:
+    """Estimate |join of Q| from sampling trials, with a confidence interval.
+
+    A trial succeeds with probability OUT / AGM of the root box, so
+    AGM * successes / trials is an unbiased estimate of OUT. Trials are run
+    in growing batches with ``PreparedSampler.sample_many`` until the
+    half-width of the Wilson interval is at most relative_error times the
+    estimate (or the interval rules out a single join tuple), max_trials
+    trials have run, or time_limit seconds have passed. Pass a sampler to
+    reuse its split tree across calls, or predicates to estimate the size of
+    the join restricted to them. max_trials must be at least 1.
+    """
+    if max_trials is not None and max_trials < 1:
+        raise ValueError(f"max_trials must be at least 1, got {max_trials}")
+    start = time.perf_counter()
+    if sampler is None:
+        sampler = PreparedSampler(W, Q, box_attributes, predicates)
+    rng = random.Random(seed)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    trials = successes = 0
+    batch_size = 64
+    while True:
+        if max_trials is not None:
+            batch_size = min(batch_size, max_trials - trials)
+        samples, batch_trials = sampler.sample_many(batch_size, rng)
+        trials += batch_trials
+        successes += len(samples)
+        agm = sampler.root.agm
+        if agm == 0:
+            return JoinSizeEstimate(0.0, 0.0, 0.0, trials, successes, agm, "empty")
+
+        low, high = wilson_interval(successes, trials, z)
+        estimate = agm * successes / trials
+        elapsed = time.perf_counter() - start
+        stopped_by = None
+        if (successes and agm * (high - low) / 2 <= relative_error * estimate) or agm * high < 1:
+            stopped_by = "relative_error"
+        elif max_trials is not None and trials >= max_trials:
+            stopped_by = "max_trials"
+        elif time_limit is not None and elapsed >= time_limit:
+            stopped_by = "time_limit"
+        if stopped_by is not None:
+            return JoinSizeEstimate(estimate, agm * low, agm * high, trials, successes, agm,
+                                    stopped_by)
+
+        # Grow the batches geometrically, but not past what fits in the
+        # remaining time at the rate observed so far.
+        batch_size = min(2 * batch_size, 1 << 14)
+        if time_limit is not None:
+            batch_size = max(1, min(batch_size, int(trials / elapsed * (time_limit - elapsed))))
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry.
+
+    ``maxsize`` bounds the number of entries kept (``None`` means unbounded
+    and ``0`` disables caching). Lookups are counted in ``hits`` and
+    ``misses`` so callers can check how effective the cache is.
+    """
+
+    def __init__(self, maxsize: Optional[int] = 1 << 16):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize == 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize: Optional[int]):
+        self.maxsize = maxsize
+        self._evict()
+
+    def _evict(self):
+        if self.maxsize is None:
+            return
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries), "maxsize": self.maxsize}
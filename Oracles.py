@@ -1,48 +1,105 @@
 import bisect
-from typing import List, Tuple, Set, Dict
-from Relation import Relation
+from typing import Callable, List, Optional, Tuple, Set, Dict
+from Relation import Relation, check_tuple_in_box
 from RangeTree import RangeTree
 from MedianBST import MedianBST
+from LRUCache import LRUCache
+from Instrumentation import instrumented
 
+# Counts keyed by (relation cache_key, box projected onto the relation),
+# stored with the relation version they were computed at.
+count_cache = LRUCache(maxsize=1 << 16)
 
-def check_tuple_in_box(relation: Relation, tuple_: Tuple[int], box: List[Tuple[int, int]], box_attributes: List[str]) -> bool:
-    for attr in relation.attributes:
-        attr_index_in_relation = relation.get_attribute_index(attr)
-        attr_index_in_box = box_attributes.index(attr)
-        if not (box[attr_index_in_box][0] <= tuple_[attr_index_in_relation] <= box[attr_index_in_box][1]):
-            return False
-    return True
 
+@instrumented
 def count_oracle(relation: Relation, box: List[Tuple[int, int]], box_attributes: List[str]) -> int:
-    points = [tuple_ for tuple_ in relation.tuples if check_tuple_in_box(relation, tuple_, box, box_attributes)]
-    range_tree = RangeTree(points)
-    return range_tree.range_count(box, box_attributes, relation.attributes)
+    key = (relation.cache_key, tuple(box[position] for position in relation.box_positions(box_attributes)))
+    entry = count_cache.get(key)
+    if entry is not None:
+        version, count = entry
+        # Counts of boxes that no update touched stay valid.
+        if version == relation.version or \
+                not relation.changed_in_box(box, box_attributes, version):
+            if version != relation.version:
+                count_cache.put(key, (relation.version, count))
+            return count
+    count = relation.range_tree.range_count(box, box_attributes, relation.attributes)
+    count_cache.put(key, (relation.version, count))
+    return count
 
 
 def get_active_domain(Q: List[Relation], X: str, box: List[Tuple[int, int]], box_attributes: List[str]) -> Set[int]:
     active_domain = set()
     for relation in Q:
         if X in relation.attributes:
-            attr_index = relation.get_attribute_index(X)
-            for tuple_ in relation.tuples:
-                if check_tuple_in_box(relation, tuple_, box, box_attributes):
-                    active_domain.add(tuple_[attr_index])
+            mask = relation.box_mask(box, box_attributes)
+            active_domain.update(relation.columns[X][mask].tolist())
     return active_domain
 
+@instrumented
+def rank_search(Q: List[Relation], X: str, interval: Tuple[int, int],
+                predicate: Callable[[int], bool]) -> Optional[int]:
+    """Return the smallest value of X in interval for which predicate holds.
+
+    Candidates are the values stored in the sorted value indexes of the
+    relations that contain X, and predicate must be monotone over them. Each
+    probe picks the middle of the widest remaining rank window, so the search
+    needs O(m log n) probes for m relations of n tuples. Returns None when no
+    candidate satisfies predicate.
+    """
+    low, high = interval
+    windows = []
+    for relation in Q:
+        if X in relation.attributes:
+            values = relation.value_index(X)
+            windows.append([values, bisect.bisect_left(values, low),
+                            bisect.bisect_right(values, high)])
+
+    result = None
+    while windows:
+        values, left, right = max(windows, key=lambda window: window[2] - window[1])
+        if left >= right:
+            break
+        pivot = values[(left + right) // 2]
+        if predicate(pivot):
+            result = pivot
+            for window in windows:
+                window[2] = bisect.bisect_left(window[0], pivot, window[1], window[2])
+        else:
+            for window in windows:
+                window[1] = bisect.bisect_right(window[0], pivot, window[1], window[2])
+    return result
+
+
+@instrumented
 def median_oracle(Q: List[Relation], X: str, box: List[Tuple[int, int]], box_attributes: List[str]) -> int:
-    active_domain = get_active_domain(Q, X, box, box_attributes)
-    median_bst = MedianBST()
-    for value in active_domain:
-        median_bst.insert(value)
-    return median_bst.find_median()
+    # Median of the X-values of the tuples inside box, i.e. the smallest value
+    # z such that at least (total // 2) + 1 of them are <= z. Counts come from
+    # the range trees and candidates from the value indexes, so no per-call
+    # structure is allocated.
+    relations = [relation for relation in Q if X in relation.attributes]
+    total = sum(count_oracle(relation, box, box_attributes) for relation in relations)
+    if total == 0:
+        raise ValueError("Box is empty")
+    median_rank = (total // 2) + 1
+
+    i = box_attributes.index(X)
+    x_i, y_i = box[i]
+    prefix_box = box.copy()
+
+    def covers_median(z: int) -> bool:
+        prefix_box[i] = (x_i, z)
+        return sum(count_oracle(relation, prefix_box, box_attributes)
+                   for relation in relations) >= median_rank
+
+    return rank_search(Q, X, (x_i, y_i), covers_median)
 
 
 
 def sub_join(Q: List[Relation], box: List[Tuple[int, int]], box_attributes: List[str]) -> Dict[str, List[Tuple[int]]]:
     sub_join_result = {}
     for relation in Q:
-        sub_relation = [tuple_ for tuple_ in relation.tuples if check_tuple_in_box(relation, tuple_, box, box_attributes)]
-        sub_join_result[relation.name] = sub_relation
+        sub_join_result[relation.name] = relation.get_sub_relation(box, box_attributes).tuples
     return sub_join_result
 
 def sub_join_induced_by_box(Q: List[Relation], box: List[Tuple[int, int]], box_attributes: List[str]) -> Dict[str, Relation]:
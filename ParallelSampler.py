@@ -0,0 +1,102 @@
+import gc
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from Relation import Relation
+from PreparedSampler import PreparedSampler
+
+# Samplers visible to the worker processes, keyed by ParallelSampler token.
+# With the fork start method the workers inherit this dict (and the relation
+# columns and indexes it references) copy-on-write instead of receiving a
+# pickled copy each.
+_samplers: Dict[int, PreparedSampler] = {}
+
+
+def _init_worker(token: int, W: List[float], Q: List[Relation], box_attributes: List[str],
+                 predicates: Optional[Dict[str, Tuple[int, int]]]):
+    # Only used when fork is unavailable: every worker rebuilds the sampler.
+    _samplers[token] = PreparedSampler(W, Q, box_attributes, predicates)
+
+
+def _run_shard(token: int, trials: int, seed: int, shard: int) -> Tuple[np.ndarray, int]:
+    rng = random.Random(f"{seed}:{shard}")
+    return _samplers[token].sample_many(trials, rng)
+
+
+def shard_sizes(k: int, shards: int) -> List[int]:
+    return [k // shards + (1 if shard < k % shards else 0) for shard in range(shards)]
+
+
+class ParallelSampler:
+    """Shard sampling trials across a pool of worker processes.
+
+    The k trials of ``sample_many`` are split into one shard per worker and
+    every shard draws from its own ``random.Random`` seeded with
+    ``"<seed>:<shard>"``. Shards are concatenated in shard order, so the
+    output only depends on the seed and the worker count, not on
+    scheduling. The indexes are built in the parent before the pool forks so
+    the workers share them instead of rebuilding them. Workers see the
+    relations as they were when the pool started, so the pool is restarted
+    when a relation of Q has been updated since.
+    """
+
+    def __init__(self, W: List[float], Q: List[Relation], box_attributes: List[str],
+                 workers: Optional[int] = None,
+                 predicates: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.W = W
+        self.Q = Q
+        self.box_attributes = box_attributes
+        self.predicates = predicates
+        self.token = id(self)
+        self._start()
+
+    def _start(self):
+        self._versions = [relation.version for relation in self.Q]
+        sampler = PreparedSampler(self.W, self.Q, self.box_attributes, self.predicates)
+        _samplers[self.token] = sampler
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            for relation in self.Q:
+                relation.range_tree  # Build before forking so workers share it
+            gc.freeze()  # Keep the collector from touching the shared pages
+            self.executor = ProcessPoolExecutor(self.workers,
+                                                mp_context=multiprocessing.get_context("fork"))
+        else:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                initargs=(self.token, self.W, self.Q,
+                                                          self.box_attributes, self.predicates))
+
+    def sample_many(self, k: int, seed: int = 0) -> Tuple[np.ndarray, int]:
+        if self._versions != [relation.version for relation in self.Q]:
+            self.executor.shutdown()
+            gc.unfreeze()
+            self._start()
+        futures = [self.executor.submit(_run_shard, self.token, trials, seed, shard)
+                   for shard, trials in enumerate(shard_sizes(k, self.workers))]
+        results = [future.result() for future in futures]
+        samples = np.concatenate([samples for samples, _ in results])
+        return samples.reshape(-1, len(self.box_attributes)), sum(trials for _, trials in results)
+
+    def close(self):
+        self.executor.shutdown()
+        _samplers.pop(self.token, None)
+        gc.unfreeze()
+
+    def __enter__(self) -> 'ParallelSampler':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parallel_sample_many(Q: List[Relation], box_attributes: List[str], k: int,
+                         W: Optional[List[float]] = None, workers: Optional[int] = None,
+                         seed: int = 0, predicates: Optional[Dict[str, Tuple[int, int]]] = None) -> \
+Tuple[np.ndarray, int]:
+    """One-shot parallel version of ``Sample.sample_many``."""
+    with ParallelSampler(W, Q, box_attributes, workers, predicates) as sampler:
+        return sampler.sample_many(k, seed)
@@ -0,0 +1,224 @@
+import random
+from collections import Counter
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+from Relation import Relation
+from Split import agm_bound, root_box, split, split_order, volume
+from Sample import leaf_join
+from AliasTable import AliasTable
+from EdgeCover import check_edge_cover, optimal_edge_cover
+import Instrumentation
+
+
+class SplitNode:
+    """A box of the split tree together with its AGM bound.
+
+    ``children`` and ``alias`` are filled in the first time a descent
+    reaches the node; ``alias`` draws a child index in proportion to the
+    child AGM bounds, with the last index standing for the nil child.
+    Leaves (AGM < 2) cache their joined tuple instead.
+    """
+
+    __slots__ = ("box", "agm", "children", "alias", "joined_tuple", "is_joined")
+
+    def __init__(self, box: List[Tuple[int, int]], agm: float):
+        self.box = box
+        self.agm = agm
+        self.children = None
+        self.alias = None
+        self.joined_tuple = None
+        self.is_joined = False
+
+
+class PreparedSampler:
+    """Sampler for a fixed query that keeps the split tree between draws.
+
+    ``sample()`` follows the same algorithm as ``Sample.sample`` but every
+    box it splits is retained together with its children's AGM bounds and
+    an alias table over them. Once the nodes on a path are materialized a
+    draw only walks cached nodes and picks each child in O(1). When a
+    relation of Q changes, only the nodes whose box contains an inserted or
+    deleted tuple get their AGM bound and alias table recomputed; the box
+    layout of the tree is kept, since any partition of a box is a valid
+    split. Nodes whose children do not cover their whole box, because split
+    pruned children with AGM 0, are split again instead, as an insert may
+    have landed in a pruned part. With predicates (attribute -> inclusive
+    (low, high)) the tree only covers the selected part of the join. A
+    given W must be a fractional edge cover of Q.
+    """
+
+    def __init__(self, W: List[float], Q: List[Relation], box_attributes: List[str],
+                 predicates: Optional[Dict[str, Tuple[int, int]]] = None):
+        if W is not None:
+            check_edge_cover(Q, box_attributes, W)
+        self.weights = W
+        self.Q = Q
+        self.box_attributes = box_attributes
+        self.predicates = predicates
+        self.reset()
+
+    def reset(self):
+        self._versions = [relation.version for relation in self.Q]
+        # The optimal cover depends on the relation sizes, so it is re-derived
+        # whenever the tree is reset.
+        self.W = self.weights if self.weights is not None else \
+            optimal_edge_cover(self.Q, self.box_attributes)
+        self.order = split_order(self.Q, self.box_attributes)
+        B = root_box(self.Q, self.box_attributes, self.predicates)
+        self.root = SplitNode(B, agm_bound(self.Q, B, self.box_attributes, self.W))
+        self.node_count = 1
+
+    def _expand(self, node: SplitNode):
+        C = split(0, node.box, self.Q, self.box_attributes, self.W, self.order)
+        node.children = [SplitNode(B_prime, agm_bound(self.Q, B_prime, self.box_attributes, self.W))
+                         for B_prime in C]
+        self._build_alias(node)
+        self.node_count += len(node.children)
+
+    def _build_alias(self, node: SplitNode):
+        weights = [child.agm for child in node.children]
+        weights.append(max(node.agm - sum(weights), 0.0))  # Weight of B_child = nil
+        node.alias = AliasTable(weights)
+
+    def refresh(self):
+        """Bring the tree up to date after relations of Q were updated.
+
+        Falls back to ``reset`` when the cover changes or the data no longer
+        fits in the root box.
+        """
+        W = self.weights if self.weights is not None else \
+            optimal_edge_cover(self.Q, self.box_attributes)
+        B = root_box(self.Q, self.box_attributes, self.predicates)
+        if W != self.W or any(low < root_low or high > root_high
+                               for (low, high), (root_low, root_high) in zip(B, self.root.box)
+                               if low <= high):
+            self.reset()
+            return
+        self._refresh(self.root, self._versions)
+        self._versions = [relation.version for relation in self.Q]
+
+    def _refresh(self, node: SplitNode, versions: List[int]):
+        if not any(relation.changed_in_box(node.box, self.box_attributes, version)
+                   for relation, version in zip(self.Q, versions)):
+            return
+        node.agm = agm_bound(self.Q, node.box, self.box_attributes, self.W)
+        node.joined_tuple = None
+        node.is_joined = False
+        if node.children is None:
+            return  # Expanded again on the next visit if it is no longer a leaf
+        if node.agm < 2 or sum(map(volume, (child.box for child in node.children))) < volume(node.box):
+            node.children = None
+            node.alias = None
+            return
+        for child in node.children:
+            self._refresh(child, versions)
+        self._build_alias(node)
+
+    def _join(self, node: SplitNode) -> Optional[Tuple[int]]:
+        if not node.is_joined:
+            node.joined_tuple = leaf_join(self.Q, node.box, self.box_attributes)
+            node.is_joined = True
+        return node.joined_tuple
+
+    def is_empty(self) -> bool:
+        """Whether the join of Q (restricted to predicates) has no tuple.
+
+        Walks the split tree depth first, expanding nodes as needed, and
+        stops at the first leaf with a join tuple. Split only prunes boxes
+        with AGM 0, so an empty join is certified once every box with a
+        non-zero AGM bound has been materialized.
+        """
+        if self._versions != [relation.version for relation in self.Q]:
+            self.refresh()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.agm >= 2:
+                if node.children is None:
+                    self._expand(node)
+                stack.extend(node.children)
+            elif node.agm > 0 and self._join(node) is not None:
+                return False
+        return True
+
+    def sample(self, rng: random.Random = random) -> Optional[Tuple[int]]:
+        # Same result convention as Sample.sample: a tuple in box_attributes
+        # order, or None on failure.
+        if self._versions != [relation.version for relation in self.Q]:
+            self.refresh()
+
+        stats = Instrumentation.active
+        depth = 0
+        node = self.root
+        while node.agm >= 2:
+            if stats is not None:
+                stats.visit(node.box)
+            if node.children is None:
+                self._expand(node)
+            child_index = node.alias.sample(rng)
+            depth += 1
+            if child_index == len(node.children):
+                if stats is not None:
+                    stats.end_descent(depth, "nil_child")
+                return None
+            node = node.children[child_index]
+
+        if stats is not None:
+            stats.visit(node.box)
+        joined_tuple = self._join(node)
+        if joined_tuple is None:
+            if stats is not None:
+                stats.end_descent(depth, "empty_leaf")
+            return None
+
+        # Toss a coin with heads probability 1 / AGM of the leaf box
+        if rng.random() < 1 / node.agm:
+            if stats is not None:
+                stats.end_descent(depth, "success")
+            return joined_tuple
+
+        if stats is not None:
+            stats.end_descent(depth, "coin_toss")
+        return None
+
+    def sample_many(self, k: int, rng: random.Random = random) -> Tuple[np.ndarray, int]:
+        """Run k trials over the cached tree and return (samples, trials).
+
+        Trials are pushed down together: at every node the alias table
+        assigns each of them a child, and the node is then visited once per
+        distinct child. See ``Sample.sample_many``.
+        """
+        if self._versions != [relation.version for relation in self.Q]:
+            self.refresh()
+
+        stats = Instrumentation.active
+        accepted = []
+        stack = [(self.root, k, 0)]
+        while stack:
+            node, trials, depth = stack.pop()
+            if stats is not None:
+                stats.visit(node.box)
+            if node.agm >= 2:
+                if node.children is None:
+                    self._expand(node)
+                counts = Counter(node.alias.sample(rng) for _ in range(trials))
+                for child_index, child_trials in counts.items():
+                    if child_index < len(node.children):
+                        stack.append((node.children[child_index], child_trials, depth + 1))
+                    elif stats is not None:
+                        stats.end_descent(depth + 1, "nil_child", child_trials)
+                continue
+
+            joined_tuple = self._join(node)
+            if joined_tuple is None:
+                if stats is not None:
+                    stats.end_descent(depth, "empty_leaf", trials)
+                continue
+            heads = sum(1 for _ in range(trials) if rng.random() < 1 / node.agm)
+            accepted.extend([joined_tuple] * heads)
+            if stats is not None:
+                stats.end_descent(depth, "success", heads)
+                stats.end_descent(depth, "coin_toss", trials - heads)
+
+        rng.shuffle(accepted)
+        return np.array(accepted, dtype=np.int64).reshape(-1, len(self.box_attributes)), k
@@ -1,18 +1,267 @@
-import bisect
-from typing import List, Tuple, Set
-from Relation import Relation
+import math
+from collections import Counter
+from typing import List, Tuple, Set, Union
+import numpy as np
+
+# Ranges and nested tree blocks of fewer points are scanned instead of indexed.
+LEAF_SIZE = 16
+LEAF_LEVEL = LEAF_SIZE.bit_length() - 1
+# Query bounds are clamped to this range so they compare as int64.
+_MIN, _MAX = -(1 << 62), 1 << 62
+
+
+def _as_points(points: Union[List[Tuple[int]], np.ndarray]) -> np.ndarray:
+    # Points as an (n x d) int64 array; an empty input has no columns.
+    points = np.asarray(points, dtype=np.int64)
+    return points.reshape(len(points), -1) if len(points) else np.empty((0, 0), dtype=np.int64)
+
+
+def _int_interval(interval: Tuple[float, float]) -> Tuple[int, int]:
+    # Integer bounds of an inclusive interval whose ends may be floats or infinite.
+    low, high = interval
+    if type(low) is int and type(high) is int and _MIN <= low and high <= _MAX:
+        return low, high
+    return (_MIN if low <= _MIN else max(math.ceil(low), _MIN),
+            _MAX if high >= _MAX else min(math.floor(high), _MAX))
+
 
 class RangeTree:
-    def __init__(self, points: List[Tuple[int]]):
-        self.points = sorted(points)
+    """Static layered range tree over d-dimensional points.
+
+    The points are sorted on dimension ``dim`` and a query range on it is
+    cut into the O(log n) canonical nodes of an implicit segment tree over
+    them (node k has children 2k and 2k + 1). Every node indexes the
+    remaining dimensions. When only one is left, all nodes share one int64
+    array of (node, value rank) keys, so one ``np.searchsorted`` counts a
+    whole query and the matching row ids are contiguous. Otherwise every
+    node over at least LEAF_SIZE points holds another ``RangeTree`` and the
+    fewer than LEAF_SIZE points left at either end are scanned, as are
+    ranges of at most LEAF_SIZE points. Counting takes O(log^d n) time after
+    an O(n log^(d-1) n) build, and reporting k points O(log^d n + k).
+    """
+
+    def __init__(self, points: Union[List[Tuple[int]], np.ndarray], dim: int = 0):
+        points = _as_points(points)
+        self.dim = dim
+        self.size = len(points)
+        self.points = points[np.argsort(points[:, dim], kind="stable")] if self.size else points
+        self.keys = self.points[:, dim] if self.size else np.empty(0, dtype=np.int64)
+        self.is_last = not self.size or dim == points.shape[1] - 1
+        self.assoc = None
+        if not self.is_last:
+            self._build()
+
+    def _build(self):
+        n = self.size
+        next_dim = self.dim + 1
+        if next_dim < self.points.shape[1] - 1:
+            # The leaves are blocks of LEAF_SIZE points; assoc[k] indexes the
+            # points of node k, or is None if they run past the last point.
+            self.leaf_level = LEAF_LEVEL
+            height = max((n - 1).bit_length() - LEAF_LEVEL, 0)
+            self.leaves = 1 << height
+            self.assoc = [None] * (2 * self.leaves)
+            for k in range(1, 2 * self.leaves):
+                depth = k.bit_length() - 1
+                s = height - depth + LEAF_LEVEL
+                b = k - (1 << depth)
+                if (b + 1) << s <= n:
+                    self.assoc[k] = RangeTree(self.points[b << s:(b + 1) << s], next_dim)
+            return
+
+        # Last dimension: rank its values, then sort the points of every node
+        # on them, one level of nodes at a time from the leaves up. A level's
+        # order refines the one below it, whose nodes are sorted halves, so
+        # the stable sort only merges runs. Levels are stored root first, so
+        # the keys k * width + rank are sorted.
+        self.leaf_level = 0
+        height = (n - 1).bit_length()
+        self.leaves = 1 << height
+        column = self.points[:, next_dim]
+        self.values = np.unique(column)
+        ranks = np.searchsorted(self.values, column)
+        self.width = len(self.values) + 1
+        positions = np.arange(n)
+        self.level_keys = np.empty((height + 1) * n, dtype=np.int64)
+        self.level_rows = np.empty((height + 1) * n, dtype=np.int32 if n < 1 << 31 else np.int64)
+        order = positions
+        for s in range(height + 1):
+            nodes = positions >> s
+            if s:
+                order = order[np.argsort(nodes[order] * self.width + ranks[order], kind="stable")]
+            depth = height - s
+            self.level_keys[depth * n:(depth + 1) * n] = ((1 << depth) + nodes) * self.width + ranks[order]
+            self.level_rows[depth * n:(depth + 1) * n] = order
+
+    def _nodes(self, left: int, right: int) -> List[int]:
+        # Canonical nodes covering leaves [left, right), in increasing order.
+        nodes, right_nodes = [], []
+        left += self.leaves
+        right += self.leaves
+        while left < right:
+            if left & 1:
+                nodes.append(left)
+                left += 1
+            if right & 1:
+                right -= 1
+                right_nodes.append(right)
+            left >>= 1
+            right >>= 1
+        return sorted(nodes + right_nodes)
+
+    def _range(self, intervals: List[Tuple[int, int]]) -> Tuple[int, int]:
+        low, high = intervals[self.dim]
+        left, right = self.keys.searchsorted((low, high + 1)).tolist()
+        return left, right
+
+    def _scan_count(self, start: int, end: int, intervals: List[Tuple[int, int]]) -> int:
+        # Points in [start, end) inside intervals on the later dimensions.
+        bounds = intervals[self.dim + 1:]
+        return sum(all(low <= value <= high for value, (low, high) in zip(point, bounds))
+                   for point in self.points[start:end, self.dim + 1:].tolist())
+
+    def _scan(self, start: int, end: int, intervals: List[Tuple[int, int]]) -> np.ndarray:
+        points = self.points[start:end]
+        lows, highs = np.array(intervals[self.dim + 1:]).T
+        tail = points[:, self.dim + 1:]
+        return points[((tail >= lows) & (tail <= highs)).all(axis=1)]
+
+    def _split(self, left: int, right: int) -> Tuple[List[int], int, int]:
+        # Canonical nodes of the leaves inside [left, right) and where they
+        # start and end; the points outside are scanned.
+        leaf = 1 << self.leaf_level
+        start = min(-(-left // leaf) * leaf, right)
+        end = max(right // leaf * leaf, start)
+        return self._nodes(start >> self.leaf_level, end >> self.leaf_level), start, end
+
+    def _rank_bounds(self, nodes: List[int], intervals: List[Tuple[int, int]]) -> List[int]:
+        # Start and end in level_keys of each node's matches, interleaved;
+        # sorted keys let searchsorted narrow each search from the last one.
+        low, high = intervals[self.dim + 1]
+        rank_low, rank_high = self.values.searchsorted((low, high + 1)).tolist()
+        keys = []
+        for k in nodes:
+            base = k * self.width
+            keys += (base + rank_low, base + rank_high)
+        return self.level_keys.searchsorted(keys).tolist()
+
+    def _count(self, intervals: List[Tuple[int, int]]) -> int:
+        left, right = self._range(intervals)
+        if left >= right:
+            return 0
+        if self.is_last:
+            return right - left
+        if right - left <= LEAF_SIZE:
+            return self._scan_count(left, right, intervals)
+
+        nodes, start, end = self._split(left, right)
+        if self.assoc is not None:
+            return self._scan_count(left, start, intervals) + self._scan_count(end, right, intervals) + \
+                sum(self.assoc[k]._count(intervals) for k in nodes)
+        bounds = self._rank_bounds(nodes, intervals)
+        return sum(bounds[1::2]) - sum(bounds[::2])
+
+    def _report(self, intervals: List[Tuple[int, int]], points: List[np.ndarray]):
+        # Same decomposition as _count, appending the points instead.
+        left, right = self._range(intervals)
+        if left >= right:
+            return
+        if self.is_last:
+            points.append(self.points[left:right])
+            return
+        if right - left <= LEAF_SIZE:
+            points.append(self._scan(left, right, intervals))
+            return
+
+        nodes, start, end = self._split(left, right)
+        if self.assoc is not None:
+            points += (self._scan(left, start, intervals), self._scan(end, right, intervals))
+            for k in nodes:
+                self.assoc[k]._report(intervals, points)
+            return
+        bounds = self._rank_bounds(nodes, intervals)
+        rows = [self.level_rows[start:end] for start, end in zip(bounds[::2], bounds[1::2]) if start < end]
+        if rows:
+            points.append(self.points[np.concatenate(rows)])
+
+    def range_count(self, box: List[Tuple[int, int]], box_attributes: List[str],
+                    relation_attributes: List[str]) -> int:
+        if self.size == 0:
+            return 0
+        intervals = [_int_interval(box[box_attributes.index(attr)])
+                     for attr in relation_attributes]
+        return self._count(intervals)
+
+    def range_report(self, box: List[Tuple[int, int]], box_attributes: List[str],
+                     relation_attributes: List[str]) -> np.ndarray:
+        # Points in box, as rows of an (k x d) array.
+        if self.size == 0:
+            return self.points
+        points = []
+        self._report([_int_interval(box[box_attributes.index(attr)])
+                      for attr in relation_attributes], points)
+        return np.concatenate(points) if points else self.points[:0]
+
+
+class DynamicRangeTree:
+    """Range counting under insertions and deletions (logarithmic method).
+
+    Inserted points live in a few static ``RangeTree`` buckets whose sizes
+    shrink geometrically: a new batch is merged with every bucket that is
+    not larger than it and the result is rebuilt, so each point takes part
+    in O(log n) rebuilds. Deleted points go into a second set of buckets
+    and are subtracted from the counts. A query costs O(log n) static
+    queries.
+    """
+
+    def __init__(self, points: Union[List[Tuple[int]], np.ndarray]):
+        self.buckets = []
+        self.deleted = []
+        self.size = 0
+        self.deleted_size = 0
+        self.insert_many(points)
+
+    @staticmethod
+    def _add(buckets: List[RangeTree], points: np.ndarray):
+        if not len(points):
+            return
+        while buckets and buckets[-1].size <= len(points):
+            points = np.concatenate((buckets.pop().points, points))
+        buckets.append(RangeTree(points))
+
+    def insert_many(self, points: Union[List[Tuple[int]], np.ndarray]):
+        points = _as_points(points)
+        self._add(self.buckets, points)
+        self.size += len(points)
+
+    def delete_many(self, points: Union[List[Tuple[int]], np.ndarray]):
+        # Points must be present; they are cancelled out, not removed.
+        points = _as_points(points)
+        self._add(self.deleted, points)
+        self.deleted_size += len(points)
 
     def range_count(self, box: List[Tuple[int, int]], box_attributes: List[str],
                     relation_attributes: List[str]) -> int:
         count = 0
-        for point in self.points:
-            if all(box[box_attributes.index(attr)][0] <= point[
-                relation_attributes.index(attr)] <=
-                   box[box_attributes.index(attr)][1] for attr in
-                   relation_attributes):
-                count += 1
+        for tree in self.buckets:
+            count += tree.range_count(box, box_attributes, relation_attributes)
+        for tree in self.deleted:
+            count -= tree.range_count(box, box_attributes, relation_attributes)
         return count
+
+    def range_report(self, box: List[Tuple[int, int]], box_attributes: List[str],
+                     relation_attributes: List[str]) -> np.ndarray:
+        # Points in box as rows of an array, with the deleted ones cancelled out.
+        points = [tree.range_report(box, box_attributes, relation_attributes) for tree in self.buckets]
+        points = np.concatenate(points) if points else np.empty((0, len(relation_attributes)), dtype=np.int64)
+        deleted = Counter(tuple_ for tree in self.deleted
+                          for tuple_ in map(tuple, tree.range_report(box, box_attributes,
+                                                                     relation_attributes).tolist()))
+        if not deleted:
+            return points
+        keep = np.ones(len(points), dtype=bool)
+        for k, tuple_ in enumerate(map(tuple, points.tolist())):
+            if deleted[tuple_]:
+                deleted[tuple_] -= 1
+                keep[k] = False
+        return points[keep]
@@ -1,28 +1,461 @@
 import bisect
+import hashlib
+import itertools
+import json
 import random
-from typing import List, Tuple, Set, Dict, Union
+import struct
+from typing import List, NamedTuple, Tuple, Set, Dict, Union, Optional
+import numpy as np
+from RangeTree import DynamicRangeTree
+
+
+class AttributeStats(NamedTuple):
+    min: int
+    max: int
+    distinct: int
+
+
+# Relation files start with this magic, a little-endian uint32 header size
+# and a JSON header, padded so the int64 columns that follow are aligned.
+FILE_MAGIC = b"CSRL0001"
+FILE_ALIGNMENT = 64
+
+# Source of Relation.cache_key, never reused within a process.
+_cache_keys = itertools.count()
+
+
+def write_file_header(f, name: str, attributes: List[str], rows: int,
+                      stats: Optional[Dict[str, AttributeStats]] = None,
+                      sorted_by: Optional[str] = None):
+    # Leaves f at the offset where the first column starts. Without stats the
+    # reader computes them from the data.
+    header = {"name": name, "attributes": attributes, "rows": rows, "sorted_by": sorted_by,
+              "stats": None if stats is None else {attr: list(values) for attr, values in stats.items()},
+              "offset": 0}
+    # The offset depends on the header size, so encode it until it is stable.
+    while True:
+        encoded = json.dumps(header).encode()
+        offset = -(-(len(FILE_MAGIC) + 4 + len(encoded)) // FILE_ALIGNMENT) * FILE_ALIGNMENT
+        if offset == header["offset"]:
+            break
+        header["offset"] = offset
+    f.write(FILE_MAGIC)
+    f.write(struct.pack("<I", len(encoded)))
+    f.write(encoded)
+    f.write(b"\0" * (offset - f.tell()))
 
 
 # Define the Relation
 class Relation:
-    def __init__(self, name: str, attributes: List[str], tuples: List[Tuple[int]]):
+    """A relation stored either as a list of tuples or as int64 columns.
+
+    The list-of-tuples constructor keeps its original behaviour. Relations
+    built with ``Relation.from_columns`` are columnar: they hold one
+    contiguous int64 array per attribute and only materialize ``tuples`` on
+    demand. Both modes evaluate box membership as a vectorized mask over the
+    columns (built lazily for list-backed relations).
+
+    ``insert_many`` and ``delete_many`` update the relation in place and
+    maintain the range tree, value indexes and statistics incrementally.
+    Relations are sets: inserting a stored tuple is a no-op.
+    Each update bumps ``version`` and is recorded in a short change log, so
+    caches can tell with ``changed_in_box`` whether a box they computed
+    something for was touched since a given version. Caches key on
+    ``cache_key`` rather than on the relation, so they never keep a dropped
+    relation (and its indexes) alive.
+    """
+
+    # Number of update batches remembered by the change log.
+    change_log_size = 64
+
+    def __init__(self, name: str, attributes: List[str], tuples: Optional[List[Tuple[int]]] = None,
+                 columns: Optional[Dict[str, np.ndarray]] = None,
+                 stats: Optional[Dict[str, AttributeStats]] = None, sorted_by: Optional[str] = None):
         self.name = name
         self.attributes = attributes
-        self.tuples = tuples
+        self.cache_key = next(_cache_keys)
+        self._tuples = tuples if tuples is not None or columns is not None else []
+        self._columns = columns
+        self._buffers = None
+        self._positions = None
+        self._box_positions = {}
+        self.version = 0
+        self._changes = []
+        self._fingerprint = None
+        self.sorted_by = sorted_by
+        self._reset_indexes(stats)
+
+    @classmethod
+    def from_columns(cls, name: str, attributes: List[str],
+                     columns: Dict[str, np.ndarray], **kwargs) -> 'Relation':
+        columns = {attr: np.ascontiguousarray(columns[attr], dtype=np.int64)
+                   for attr in attributes}
+        return cls(name, attributes, columns=columns, **kwargs)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Relation':
+        """Memory-map a file written by ``save`` as a columnar relation.
+
+        The columns are read-only views of the file, so nothing is copied
+        and only the pages the indexes and oracles touch become resident.
+        Statistics come from the header, when it has them, instead of a pass
+        over the data.
+        """
+        with open(path, "rb") as f:
+            magic, header_size = f.read(len(FILE_MAGIC)), struct.unpack("<I", f.read(4))[0]
+            if magic != FILE_MAGIC:
+                raise ValueError(f"{path} is not a relation file")
+            header = json.loads(f.read(header_size))
+        attributes = header["attributes"]
+        if header["rows"] == 0:
+            data = np.empty((len(attributes), 0), dtype=np.int64)
+        else:
+            data = np.memmap(path, dtype="<i8", mode="r", offset=header["offset"],
+                             shape=(len(attributes), header["rows"]))
+        stats = None
+        if header["stats"] is not None:
+            stats = {attr: AttributeStats(*values) for attr, values in header["stats"].items()}
+        return cls.from_columns(header["name"], attributes,
+                                {attr: data[k] for k, attr in enumerate(attributes)},
+                                stats=stats, sorted_by=header["sorted_by"])
+
+    def save(self, path: str, sort_by: Optional[str] = None):
+        """Write the relation as a header plus one int64 column per attribute.
+
+        With sort_by the rows are stored sorted on that attribute (ties by
+        the others), so value indexes and range trees over it are built
+        from already sorted data.
+        """
+        columns = [self.columns[attr] for attr in self.attributes]
+        if sort_by is not None and len(self):
+            k = self.attributes.index(sort_by)
+            order = np.lexsort(columns[k + 1:] + columns[:k] + [columns[k]])
+            columns = [column[order] for column in columns]
+        with open(path, "wb") as f:
+            write_file_header(f, self.name, self.attributes, len(self), self.stats, sort_by)
+            for column in columns:
+                np.ascontiguousarray(column, dtype="<i8").tofile(f)
+
+    def _reset_indexes(self, stats: Optional[Dict[str, AttributeStats]] = None):
+        self._range_tree = None
+        self._value_indexes = {}
+        self._value_counts = {}
+        self._tries = {}
+        if stats is not None:
+            self.stats = stats
+        else:
+            self._build_stats()
+
+    def _build_stats(self):
+        # Per-attribute min, max and distinct count, taken from the sorted
+        # value index in one pass over each column. Empty relations have none.
+        self.stats = {}
+        if len(self) == 0:
+            return
+        for attr in self.attributes:
+            values = self.value_index(attr)
+            self.stats[attr] = AttributeStats(values[0], values[-1], len(values))
+
+    @property
+    def is_columnar(self) -> bool:
+        return self._tuples is None
+
+    @property
+    def tuples(self) -> List[Tuple[int]]:
+        if self._tuples is None:
+            # Columnar mode: build the rows on demand instead of keeping them.
+            return list(zip(*(self._columns[attr].tolist() for attr in self.attributes)))
+        return self._tuples
+
+    @tuples.setter
+    def tuples(self, tuples: List[Tuple[int]]):
+        self._tuples = tuples
+        self._columns = None
+        self._buffers = None
+        self._positions = None
+        self.sorted_by = None
+        self.version += 1
+        self._changes = []  # Everything changed, nothing can be revalidated
+        self._reset_indexes()
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        if self._columns is None:
+            rows = np.array(self._tuples, dtype=np.int64).reshape(-1, len(self.attributes))
+            self._columns = {attr: np.ascontiguousarray(rows[:, k])
+                             for k, attr in enumerate(self.attributes)}
+        return self._columns
+
+    def __len__(self) -> int:
+        if self._tuples is None:
+            return len(self._columns[self.attributes[0]])
+        return len(self._tuples)
+
+    @property
+    def range_tree(self) -> DynamicRangeTree:
+        # Built lazily on the first count and reused by every later query.
+        if self._range_tree is None:
+            columns = self.columns
+            self._range_tree = DynamicRangeTree(np.stack([columns[attr] for attr in self.attributes], axis=1))
+        return self._range_tree
+
+    def value_index(self, attr: str) -> List[int]:
+        # Sorted distinct values of attr, built once and reused by the oracles.
+        values = self._value_indexes.get(attr)
+        if values is None:
+            column = self.columns[attr]
+            if attr == self.sorted_by:
+                # Already sorted on disk, deduplicating is a linear pass.
+                values = column[np.flatnonzero(np.diff(column, prepend=column[:1] - 1))].tolist()
+            else:
+                values = np.unique(column).tolist()
+            self._value_indexes[attr] = values
+        return values
+
+    def fingerprint(self) -> str:
+        """Checksum of the attributes and data, used to validate index snapshots."""
+        if self._fingerprint is None or self._fingerprint[0] != self.version:
+            digest = hashlib.blake2b(json.dumps(self.attributes).encode(), digest_size=16)
+            for attr in self.attributes:
+                digest.update(np.ascontiguousarray(self.columns[attr], dtype="<i8").data)
+            self._fingerprint = (self.version, digest.hexdigest())
+        return self._fingerprint[1]
+
+    def index_state(self) -> Dict:
+        # The indexes built so far, in a form that can be pickled.
+        return {"range_tree": self._range_tree, "value_indexes": self._value_indexes,
+                "tries": self._tries, "stats": self.stats}
+
+    def restore_index_state(self, state: Dict):
+        # Install indexes saved by index_state for the same data.
+        self._range_tree = state["range_tree"]
+        self._value_indexes = state["value_indexes"]
+        self._value_counts = {}
+        self._tries = state["tries"]
+        self.stats = state["stats"]
+
+    def _value_count(self, attr: str) -> Dict[int, int]:
+        # Multiplicity of every value of attr, only needed once tuples are deleted.
+        counts = self._value_counts.get(attr)
+        if counts is None:
+            values, multiplicities = np.unique(self.columns[attr], return_counts=True)
+            counts = dict(zip(values.tolist(), multiplicities.tolist()))
+            self._value_counts[attr] = counts
+        return counts
+
+    def _rows(self, tuples: List[Tuple[int]]) -> np.ndarray:
+        return np.array(tuples, dtype=np.int64).reshape(-1, len(self.attributes))
+
+    def _position_index(self) -> Dict[Tuple[int], int]:
+        # Row number of every stored tuple, built on the first update. The
+        # samplers assume set semantics, so duplicates cannot be updated.
+        if self._positions is None:
+            positions = {tuple_: k for k, tuple_ in enumerate(self.tuples)}
+            if len(positions) != len(self):
+                raise ValueError(f"Relation {self.name} has duplicate tuples")
+            self._positions = positions
+        return self._positions
+
+    def _reserve(self, size: int):
+        # Make the columns views of buffers this relation owns and that hold
+        # at least size rows, doubling the capacity when it runs out.
+        if self._columns is None:
+            return
+        n = len(self)
+        if self._buffers is None or len(self._buffers[self.attributes[0]]) < size:
+            capacity = max(size, 2 * n, 16) if size > n else n
+            buffers = {attr: np.empty(capacity, dtype=np.int64) for attr in self.attributes}
+            for attr in self.attributes:
+                buffers[attr][:n] = self._columns[attr]
+            self._buffers = buffers
+        self._columns = {attr: self._buffers[attr][:n] for attr in self.attributes}
+
+    def insert_many(self, tuples: List[Tuple[int]]):
+        """Add the tuples that are not stored yet and update the indexes built so far.
+
+        Costs O(len(tuples)) amortized plus the index updates, once the
+        position index has been built by the first update.
+        """
+        positions = self._position_index()
+        tuples = [tuple_ for tuple_ in dict.fromkeys(tuple(row) for row in self._rows(tuples).tolist())
+                  if tuple_ not in positions]
+        if not tuples:
+            return
+        rows = self._rows(tuples)
+        n = len(self)
+        for k, tuple_ in enumerate(tuples):
+            positions[tuple_] = n + k
+        if self._columns is not None:
+            self._reserve(n + len(rows))
+            for k, attr in enumerate(self.attributes):
+                self._buffers[attr][n:n + len(rows)] = rows[:, k]
+            self._columns = {attr: self._buffers[attr][:n + len(rows)] for attr in self.attributes}
+        if self._tuples is not None:
+            self._tuples.extend(tuples)
+        if self._range_tree is not None:
+            self._range_tree.insert_many(rows)
+
+        for k, attr in enumerate(self.attributes):
+            new_values = np.unique(rows[:, k]).tolist()
+            counts = self._value_counts.get(attr)
+            if counts is not None:
+                for value in rows[:, k].tolist():
+                    counts[value] = counts.get(value, 0) + 1
+            values = self._value_indexes.get(attr)
+            if values is not None:
+                self._value_indexes[attr] = self._merge(values, new_values)
+        self._updated(rows)
+
+    @staticmethod
+    def _merge(values: List[int], new_values: List[int]) -> List[int]:
+        # A few new values are inserted in place, larger batches merged in C.
+        if len(new_values) > 64:
+            return np.union1d(values, new_values).tolist()
+        for value in new_values:
+            k = bisect.bisect_left(values, value)
+            if k == len(values) or values[k] != value:
+                values.insert(k, value)
+        return values
+
+    def delete_many(self, tuples: List[Tuple[int]]):
+        """Remove the given tuples; absent ones are ignored.
+
+        Rows are found through the position index and the last rows are
+        moved into the holes, so a batch costs O(len(tuples)) plus the index
+        updates. Row order is not kept, and columns fetched before the call
+        may be overwritten.
+        """
+        positions = self._position_index()
+        tuples = [tuple_ for tuple_ in dict.fromkeys(tuple(row) for row in self._rows(tuples).tolist())
+                  if tuple_ in positions]
+        if not tuples:
+            return
+        value_counts = [self._value_count(attr) for attr in self.attributes]
+        removed = self._rows(tuples)
+        n = len(self)
+        size = n - len(tuples)
+        deleted = {positions.pop(tuple_) for tuple_ in tuples}
+        holes = sorted(k for k in deleted if k < size)
+        movers = [k for k in range(size, n) if k not in deleted]
+        if self._columns is not None:
+            self._reserve(n)
+            for attr in self.attributes:
+                buffer = self._buffers[attr]
+                buffer[holes] = buffer[movers]
+            self._columns = {attr: self._buffers[attr][:size] for attr in self.attributes}
+        if self._tuples is not None:
+            for hole, mover in zip(holes, movers):
+                self._tuples[hole] = self._tuples[mover]
+            del self._tuples[size:]
+            moved = [self._tuples[hole] for hole in holes]
+        else:
+            moved = list(zip(*(self._columns[attr][holes].tolist() for attr in self.attributes)))
+        for hole, tuple_ in zip(holes, moved):
+            positions[tuple_] = hole
+        if self._range_tree is not None:
+            self._range_tree.delete_many(removed)
+            if 2 * self._range_tree.deleted_size > self._range_tree.size:
+                self._range_tree = None  # Mostly cancelled out, rebuild lazily
+
+        for k, (attr, counts) in enumerate(zip(self.attributes, value_counts)):
+            values = self._value_indexes.get(attr)
+            for value in removed[:, k].tolist():
+                counts[value] -= 1
+                if counts[value] == 0:
+                    del counts[value]
+                    if values is not None:
+                        del values[bisect.bisect_left(values, value)]
+        self._updated(removed)
+
+    def _updated(self, rows: np.ndarray):
+        self.sorted_by = None
+        self.version += 1
+        self._changes.append((self.version, rows))
+        del self._changes[:-self.change_log_size]
+        self._tries = {}
+        self._build_stats()
+
+    def changed_in_box(self, box: List[Tuple[int, int]], box_attributes: List[str],
+                       since_version: int) -> bool:
+        """Whether a tuple inserted or deleted after since_version lies in box.
+
+        Answers True when the change log no longer reaches back that far.
+        """
+        if since_version == self.version:
+            return False
+        if not self._changes or self._changes[0][0] > since_version + 1:
+            return True
+        positions = self.box_positions(box_attributes)
+        for version, rows in self._changes:
+            if version <= since_version:
+                continue
+            mask = np.ones(len(rows), dtype=bool)
+            for k, position in enumerate(positions):
+                low, high = box[position]
+                mask &= (rows[:, k] >= low) & (rows[:, k] <= high)
+            if mask.any():
+                return True
+        return False
+
+    def trie(self, attribute_order: List[str]) -> Dict:
+        # Nested dicts keyed by the relation attributes in attribute_order;
+        # the leaves count duplicate tuples. Built once per order.
+        key = tuple(attribute_order)
+        root = self._tries.get(key)
+        if root is None:
+            positions = sorted(range(len(self.attributes)),
+                               key=lambda k: attribute_order.index(self.attributes[k]))
+            root = {}
+            for tuple_ in self.tuples:
+                node = root
+                for k in positions[:-1]:
+                    node = node.setdefault(tuple_[k], {})
+                last = tuple_[positions[-1]]
+                node[last] = node.get(last, 0) + 1
+            self._tries[key] = root
+        return root
 
     def get_attribute_index(self, attr: str) -> int:
         return self.attributes.index(attr)
 
+    def box_positions(self, box_attributes: List[str]) -> List[int]:
+        # Position in box_attributes of each relation attribute, computed once.
+        key = tuple(box_attributes)
+        positions = self._box_positions.get(key)
+        if positions is None:
+            positions = [box_attributes.index(attr) for attr in self.attributes]
+            self._box_positions[key] = positions
+        return positions
+
+    def box_mask(self, box: List[Tuple[int, int]], box_attributes: List[str]) -> np.ndarray:
+        columns = self.columns
+        mask = np.ones(len(self), dtype=bool)
+        for attr, position in zip(self.attributes, self.box_positions(box_attributes)):
+            low, high = box[position]
+            column = columns[attr]
+            mask &= column >= low
+            mask &= column <= high
+        return mask
+
+    def box_rows(self, box: List[Tuple[int, int]], box_attributes: List[str]) -> np.ndarray:
+        # Tuples inside box as rows of an int64 array, reported by the range
+        # tree in O(log^d n + k).
+        return self.range_tree.range_report(box, box_attributes, self.attributes)
+
+    def box_tuples(self, box: List[Tuple[int, int]], box_attributes: List[str]) -> List[Tuple[int]]:
+        return list(map(tuple, self.box_rows(box, box_attributes).tolist()))
+
     def get_sub_relation(self, box: List[Tuple[int, int]],
                          box_attributes: List[str]) -> 'Relation':
-        sub_tuples = [tuple_ for tuple_ in self.tuples if
-                      check_tuple_in_box(self, tuple_, box, box_attributes)]
+        mask = self.box_mask(box, box_attributes)
+        if self.is_columnar:
+            return Relation.from_columns(self.name, self.attributes,
+                                         {attr: column[mask] for attr, column in self._columns.items()})
+        sub_tuples = [self._tuples[k] for k in np.flatnonzero(mask).tolist()]
         return Relation(self.name, self.attributes, sub_tuples)
 
 def check_tuple_in_box(relation: Relation, tuple_: Tuple[int], box: List[Tuple[int, int]], box_attributes: List[str]) -> bool:
-    for attr in relation.attributes:
-        attr_index_in_relation = relation.get_attribute_index(attr)
-        attr_index_in_box = box_attributes.index(attr)
-        if not (box[attr_index_in_box][0] <= tuple_[attr_index_in_relation] <= box[attr_index_in_box][1]):
+    for value, position in zip(tuple_, relation.box_positions(box_attributes)):
+        if not (box[position][0] <= value <= box[position][1]):
             return False
     return True
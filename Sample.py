@@ -0,0 +1,218 @@
+import bisect
+from typing import Dict, List, Optional, Tuple, Set, Union
+from Relation import Relation
+from RangeTree import RangeTree
+from Oracles import count_oracle
+from Split import agm_bound, root_box, split, split_order
+from GenericJoin import generic_join, join_count
+from EdgeCover import check_edge_cover, optimal_edge_cover
+from AcyclicSampler import acyclic_plan
+import Instrumentation
+from Instrumentation import instrumented
+import random
+import time
+from collections import Counter, defaultdict
+import numpy as np
+
+
+def join_relations(Q: List[Relation], box_attributes: List[str]) -> List[
+    Tuple[int]]:
+    # Full join of Q in box_attributes order, see GenericJoin.generic_join.
+    return list(generic_join(Q, box_attributes))
+
+
+def join_size(Q: List[Relation], box_attributes: List[str]) -> int:
+    # |join of Q| (OUT) without materializing the join.
+    return join_count(Q, box_attributes)
+
+
+@instrumented
+def leaf_join(Q: List[Relation], B: List[Tuple[int, int]],
+              box_attributes: List[str]) -> Optional[Tuple[int]]:
+    """Return the join tuple of the sub-relations induced by B, or None.
+
+    Called on leaves, where AGM(B) < 2 bounds the join of Q(B) to at most
+    one tuple. Each relation's tuples in B are reported by its range tree,
+    so fetching them costs O(log^d n) plus their number rather than a scan.
+    They are hash-joined smallest first: each set is indexed on the
+    attributes it shares with those already joined and probed with the
+    partial bindings, so the cost is linear in the leaf's size for acyclic
+    and cyclic queries alike.
+    """
+    relations = []
+    for relation in Q:
+        tuples = relation.box_tuples(B, box_attributes)
+        if not tuples:
+            return None
+        relations.append((relation.attributes, tuples))
+    if not relations:
+        return None
+    relations.sort(key=lambda relation: len(relation[1]))
+
+    bound = set()
+    bindings = [{}]
+    for attributes, tuples in relations:
+        shared = [k for k, attr in enumerate(attributes) if attr in bound]
+        index = defaultdict(list)
+        for tuple_ in tuples:
+            index[tuple(tuple_[k] for k in shared)].append(tuple_)
+        shared_attrs = [attributes[k] for k in shared]
+        bindings = [{**binding, **dict(zip(attributes, tuple_))}
+                    for binding in bindings
+                    for tuple_ in index.get(tuple(binding[attr] for attr in shared_attrs), ())]
+        if not bindings:
+            return None
+        bound.update(attributes)
+
+    return tuple(bindings[0][attr] for attr in box_attributes)
+
+
+def sample(W: List[float], Q: List[Relation], box_attributes: List[str],
+           predicates: Optional[Dict[str, Tuple[int, int]]] = None,
+           engine: str = "auto") -> Optional[Tuple[int]]:
+    # One trial: the sampled tuple in box_attributes order, or None on failure.
+    # predicates restrict the join to tuples with low <= value <= high per
+    # attribute; they only narrow the root box, see Split.root_box. With
+    # engine "auto" acyclic joins are drawn by AcyclicSampler, whose trials
+    # never fail, once AcyclicPlan finds it worth building (until then, and
+    # after updates, the AGM sampler serves); "agm" always uses the AGM
+    # split sampler below. A given W must be a fractional edge cover of Q,
+    # see EdgeCover.check_edge_cover.
+    if W is not None:
+        check_edge_cover(Q, box_attributes, W)
+    if engine == "auto":
+        plan = acyclic_plan(Q, box_attributes, predicates)
+        if plan is not None:
+            exact = plan.sampler()
+            if exact is not None:
+                return exact.sample()
+            start = time.perf_counter()
+            result = _agm_sample(W, Q, box_attributes, predicates)
+            plan.charge(time.perf_counter() - start)
+            return result
+    elif engine != "agm":
+        raise ValueError(f"Unknown engine {engine}")
+    return _agm_sample(W, Q, box_attributes, predicates)
+
+
+def _agm_sample(W: Optional[List[float]], Q: List[Relation], box_attributes: List[str],
+                predicates: Optional[Dict[str, Tuple[int, int]]]) -> Optional[Tuple[int]]:
+    stats = Instrumentation.active
+    B = root_box(Q, box_attributes, predicates)
+    if W is None:
+        W = optimal_edge_cover(Q, box_attributes)
+    order = split_order(Q, box_attributes)
+
+    depth = 0
+    agm_B = agm_bound(Q, B, box_attributes, W)
+    while agm_B >= 2:
+        if stats is not None:
+            stats.visit(B)
+        C = split(0, B, Q, box_attributes, W, order)
+        depth += 1
+
+        # Calculate probabilities
+        agm_C = [agm_bound(Q, B_prime, box_attributes, W) for B_prime in C]
+        prob = [agm_B_prime / agm_B for agm_B_prime in agm_C]
+        prob.append(1 - sum(prob))  # Probability for B_child = nil
+
+        # Choose B_child with weighted probability
+        B_child_index = random.choices(range(len(prob)), weights=prob, k=1)[0]
+        if B_child_index == len(prob) - 1:
+            if stats is not None:
+                stats.end_descent(depth, "nil_child")
+            return None
+        B = C[B_child_index]
+        agm_B = agm_C[B_child_index]
+
+    if stats is not None:
+        stats.visit(B)
+    joined_tuple = leaf_join(Q, B, box_attributes)
+    if joined_tuple is None:
+        if stats is not None:
+            stats.end_descent(depth, "empty_leaf")
+        return None
+
+    # Toss a coin with heads probability 1 / agm_bound(Q, B, box_attributes, W)
+    if random.random() < 1 / agm_B:
+        if stats is not None:
+            stats.end_descent(depth, "success")
+        return joined_tuple
+
+    if stats is not None:
+        stats.end_descent(depth, "coin_toss")
+    return None
+
+
+def sample_many(Q: List[Relation], box_attributes: List[str], k: int,
+                W: Optional[List[float]] = None, rng: random.Random = random,
+                predicates: Optional[Dict[str, Tuple[int, int]]] = None,
+                engine: str = "auto") -> Tuple[np.ndarray, int]:
+    """Run k sampling trials together and return (samples, trials).
+
+    Instead of k independent descents, the trials that reach a box are
+    split among its children (and the nil child) with one multinomial
+    draw, so each box on the way is split and counted once no matter how
+    many trials pass through it. Trials that reach the same leaf share its
+    join and only toss their own coins. The accepted tuples are returned
+    in random order as an int64 array with one row per sample, in
+    box_attributes order. W, predicates and engine are as in ``sample``.
+    """
+    if W is not None:
+        check_edge_cover(Q, box_attributes, W)
+    if engine == "auto":
+        plan = acyclic_plan(Q, box_attributes, predicates)
+        if plan is not None:
+            exact = plan.sampler()
+            if exact is not None:
+                return exact.sample_many(k, rng)
+            start = time.perf_counter()
+            result = _agm_sample_many(Q, box_attributes, k, W, rng, predicates)
+            plan.charge(time.perf_counter() - start)
+            return result
+    elif engine != "agm":
+        raise ValueError(f"Unknown engine {engine}")
+    return _agm_sample_many(Q, box_attributes, k, W, rng, predicates)
+
+
+def _agm_sample_many(Q: List[Relation], box_attributes: List[str], k: int,
+                     W: Optional[List[float]], rng: random.Random,
+                     predicates: Optional[Dict[str, Tuple[int, int]]]) -> Tuple[np.ndarray, int]:
+    d = len(box_attributes)
+    B = root_box(Q, box_attributes, predicates)
+    if W is None:
+        W = optimal_edge_cover(Q, box_attributes)
+    order = split_order(Q, box_attributes)
+    stats = Instrumentation.active
+    accepted = []
+
+    stack = [(B, agm_bound(Q, B, box_attributes, W), k, 0)]
+    while stack:
+        B, agm_B, trials, depth = stack.pop()
+        if stats is not None:
+            stats.visit(B)
+        if agm_B >= 2:
+            C = split(0, B, Q, box_attributes, W, order)
+            agm_C = [agm_bound(Q, B_prime, box_attributes, W) for B_prime in C]
+            weights = agm_C + [max(agm_B - sum(agm_C), 0.0)]  # Last one is nil
+            counts = Counter(rng.choices(range(len(weights)), weights=weights, k=trials))
+            for child_index, child_trials in counts.items():
+                if child_index < len(C):
+                    stack.append((C[child_index], agm_C[child_index], child_trials, depth + 1))
+                elif stats is not None:
+                    stats.end_descent(depth + 1, "nil_child", child_trials)
+            continue
+
+        joined_tuple = leaf_join(Q, B, box_attributes)
+        if joined_tuple is None:
+            if stats is not None:
+                stats.end_descent(depth, "empty_leaf", trials)
+            continue
+        heads = sum(1 for _ in range(trials) if rng.random() < 1 / agm_B)
+        accepted.extend([joined_tuple] * heads)
+        if stats is not None:
+            stats.end_descent(depth, "success", heads)
+            stats.end_descent(depth, "coin_toss", trials - heads)
+
+    rng.shuffle(accepted)
+    return np.array(accepted, dtype=np.int64).reshape(-1, d), k
@@ -0,0 +1,109 @@
+import os
+import random
+import shutil
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from Relation import Relation, write_file_header
+from PreparedSampler import PreparedSampler
+
+
+def iter_samples(Q: List[Relation], box_attributes: List[str], W: Optional[List[float]] = None,
+                 seed: Optional[int] = None, num_samples: Optional[int] = None,
+                 batch_size: int = 1024,
+                 predicates: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_trials: Optional[int] = None) -> Iterator[Tuple[int]]:
+    """Yield uniform samples of the join of Q as tuples in box_attributes order.
+
+    Trials are run batch_size at a time with ``PreparedSampler.sample_many``
+    on a ``random.Random(seed)`` stream, and only the accepted tuples of the
+    current batch are held, so memory does not grow with the number of
+    samples. Stops after num_samples samples, after max_trials trials, or
+    when the join (restricted to predicates, as in ``Sample.sample``) is
+    empty: after every batch that accepts nothing,
+    ``PreparedSampler.is_empty`` checks the split tree for a join tuple.
+    Without either limit a non-empty join is sampled forever.
+    """
+    sampler = PreparedSampler(W, Q, box_attributes, predicates)
+    rng = random.Random(seed)
+    remaining = num_samples
+    trials = 0
+    while (remaining is None or remaining > 0) and (max_trials is None or trials < max_trials):
+        samples, batch_trials = sampler.sample_many(batch_size, rng)
+        trials += batch_trials
+        if not len(samples) and sampler.is_empty():
+            return
+        rows = samples.tolist()
+        if remaining is not None:
+            rows = rows[:remaining]
+            remaining -= len(rows)
+        for row in rows:
+            yield tuple(row)
+
+
+class SampleWriter:
+    """Buffered writer that appends samples to a TSV or binary relation file.
+
+    The header is derived from box_attributes. Samples are buffered and
+    flushed every buffer_size rows. TSV rows go straight to the file. In
+    binary mode every attribute is spilled to its own temporary column file
+    and ``close`` stitches them behind a ``Relation.save`` style header, so
+    the result can be opened with ``Relation.from_file``. Either way memory
+    stays bounded by the buffer.
+    """
+
+    def __init__(self, path: str, box_attributes: List[str], binary: bool = False,
+                 buffer_size: int = 1 << 14, name: str = "samples"):
+        self.path = path
+        self.box_attributes = box_attributes
+        self.binary = binary
+        self.buffer_size = buffer_size
+        self.name = name
+        self.rows = 0
+        self._buffer = []
+        if binary:
+            self._spills = [tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+                            for _ in box_attributes]
+        else:
+            self._file = open(path, "w")
+            self._file.write("\t".join(box_attributes) + "\n")
+
+    def write(self, sample: Tuple[int]):
+        self._buffer.append(sample)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, samples: Iterable[Tuple[int]]):
+        for sample in samples:
+            self.write(sample)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self.binary:
+            rows = np.array(self._buffer, dtype="<i8").reshape(-1, len(self.box_attributes))
+            for k, spill in enumerate(self._spills):
+                np.ascontiguousarray(rows[:, k]).tofile(spill)
+        else:
+            self._file.write("".join("\t".join(map(str, sample)) + "\n" for sample in self._buffer))
+            self._file.flush()
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        if not self.binary:
+            self._file.close()
+            return
+        with open(self.path, "wb") as f:
+            write_file_header(f, self.name, self.box_attributes, self.rows)
+            for spill in self._spills:
+                spill.seek(0)
+                shutil.copyfileobj(spill, f)
+                spill.close()
+
+    def __enter__(self) -> 'SampleWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
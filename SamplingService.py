@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from Relation import Relation
+from PreparedSampler import PreparedSampler
+from AcyclicSampler import AcyclicSampler, join_tree
+from LRUCache import LRUCache
+
+# Queries served, by name, as (Q, box_attributes). Set before the pool forks
+# so the workers share the relations and their indexes copy-on-write.
+_queries: Dict[str, Tuple[List[Relation], List[str]]] = {}
+# Samplers per query, built before the pool forks, and per (query,
+# predicates), built lazily in each process. Predicates come from clients
+# and each sampler costs a pass over the rows they select, so only a few
+# of those are kept.
+_samplers: Dict[str, Union[AcyclicSampler, PreparedSampler]] = {}
+_predicate_samplers = LRUCache(maxsize=1 << 4)
+
+Predicates = Tuple[Tuple[str, Tuple[int, int]], ...]
+
+
+def _init_worker(queries: Dict[str, Tuple[List[Relation], List[str]]]):
+    # Only used when fork is unavailable: every worker gets its own copy.
+    _queries.update(queries)
+
+
+def _sampler(query: str, predicates: Predicates) -> Union[AcyclicSampler, PreparedSampler]:
+    sampler = _predicate_samplers.get((query, predicates)) if predicates else _samplers.get(query)
+    if sampler is None:
+        Q, box_attributes = _queries[query]
+        # The relations do not change while served, so an acyclic query's
+        # exact sampler is built once and never rebuilt.
+        if join_tree(Q) is not None:
+            sampler = AcyclicSampler(Q, box_attributes, dict(predicates))
+        else:
+            sampler = PreparedSampler(None, Q, box_attributes, dict(predicates))
+        if not predicates:
+            _samplers[query] = sampler
+        else:
+            _predicate_samplers.put((query, predicates), sampler)
+    return sampler
+
+
+def _predicate_key(query: str, predicates) -> Predicates:
+    # Hashable, sorted form of a request's predicates, which must map
+    # attributes of the query to [low, high] integer ranges.
+    if predicates is None:
+        return ()
+    if not isinstance(predicates, dict):
+        raise ValueError(f"predicates must map attributes to [low, high] ranges, got {predicates!r}")
+    box_attributes = _queries[query][1]
+    key = []
+    for attr, interval in predicates.items():
+        if attr not in box_attributes:
+            raise ValueError(f"Unknown attribute {attr!r} for query {query}")
+        if not isinstance(interval, (list, tuple)) or len(interval) != 2 or \
+                not all(isinstance(value, int) and not isinstance(value, bool) for value in interval):
+            raise ValueError(f"Range for {attr!r} must be [low, high] integers, got {interval!r}")
+        key.append((attr, tuple(interval)))
+    return tuple(sorted(key))
+
+
+def _draw(query: str, predicates: Predicates, seed: Optional[int], k: int,
+          batch_size: int, max_trials: Optional[int]) -> Tuple[np.ndarray, int]:
+    # Up to k samples, drawn batch_size trials at a time. The batches do not
+    # depend on k, so with a seed every k gets a prefix of the same stream.
+    sampler = _sampler(query, predicates)
+    rng = random.Random(seed)
+    batches = []
+    samples = trials = 0
+    while samples < k and (max_trials is None or trials < max_trials):
+        if (isinstance(sampler, AcyclicSampler) and not sampler.size) or \
+                (isinstance(sampler, PreparedSampler) and not sampler.root.agm):
+            break  # Empty join
+        batch, batch_trials = sampler.sample_many(batch_size, rng)
+        batches.append(batch)
+        samples += len(batch)
+        trials += batch_trials
+    width = len(_queries[query][1])
+    return np.concatenate(batches or [np.empty((0, width), np.int64)])[:k], trials
+
+
+class SamplingService:
+    """Resident sampler for a fixed set of named queries.
+
+    Clients send newline-delimited JSON requests
+    ``{"query": name, "k": samples, "predicates": {attr: [low, high]},
+    "seed": int}`` (all but query and k optional, plus an optional "id"
+    that is echoed back) and get ``{"samples": [...], "trials": n,
+    "coalesced": m}`` or ``{"error": message}`` per line. Requests for the
+    same (query, predicates, seed) that arrive within coalesce_window
+    seconds of each other are answered by one draw: unseeded requests get
+    disjoint slices of it, seeded ones all get a prefix of the same seeded
+    stream, i.e. exactly what they would get alone. Draws run in a process
+    pool so the event loop only parses and routes requests.
+    """
+
+    def __init__(self, queries: Dict[str, Tuple[List[Relation], List[str]]],
+                 workers: Optional[int] = None, batch_size: int = 1024,
+                 max_trials: Optional[int] = 1 << 24, coalesce_window: float = 0.002):
+        self.batch_size = batch_size
+        self.max_trials = max_trials
+        self.coalesce_window = coalesce_window
+        self._pending: Dict[Tuple, List[Tuple[int, asyncio.Future]]] = {}
+        self._flushes = set()  # The event loop only keeps weak references to tasks
+        _queries.update(queries)
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            for name in queries:
+                _sampler(name, ())  # Build before forking so workers share it
+            self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+        else:
+            self.executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(queries,))
+
+    async def submit(self, query: str, k: int, predicates: Optional[Dict[str, Tuple[int, int]]] = None,
+                     seed: Optional[int] = None) -> Tuple[np.ndarray, int, int]:
+        """(samples, trials, coalesced requests) for one request."""
+        if query not in _queries:
+            raise ValueError(f"Unknown query {query}")
+        if k < 0:
+            raise ValueError(f"k must be non-negative, got {k}")
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            raise ValueError(f"seed must be an integer, got {seed!r}")
+        key = (query, _predicate_key(query, predicates), seed)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            loop.call_later(self.coalesce_window, self._schedule_flush, key)
+        batch.append((k, future))
+        return await future
+
+    def _schedule_flush(self, key: Tuple):
+        task = asyncio.get_running_loop().create_task(self._flush(key))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, key: Tuple):
+        batch = self._pending.pop(key)
+        query, predicates, seed = key
+        k = max(k for k, _ in batch) if seed is not None else sum(k for k, _ in batch)
+        try:
+            samples, trials = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _draw, query, predicates, seed, k, self.batch_size, self.max_trials)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():  # Cancelled if its client went away
+                    future.set_exception(error)
+            return
+        offset = 0
+        for k, future in batch:
+            part = samples[:k] if seed is not None else samples[offset:offset + k]
+            offset += k
+            if not future.done():
+                future.set_result((part, trials, len(batch)))
+
+    async def _respond(self, line: bytes) -> Dict:
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            if "id" in request:
+                response["id"] = request["id"]
+            samples, trials, coalesced = await self.submit(request["query"], int(request["k"]),
+                                                           request.get("predicates"), request.get("seed"))
+        except Exception as error:
+            # Malformed requests and failed draws alike get an error line;
+            # the connection stays open for the next request.
+            response["error"] = f"{type(error).__name__}: {error}"
+            return response
+        response.update(samples=samples.tolist(), trials=trials, coalesced=coalesced)
+        return response
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Requests on one connection are answered in order; concurrency (and
+        # coalescing) comes from concurrent connections.
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as error:
+                    # Longer than the stream limit: the rest of the line is
+                    # unread, so answer and drop the connection.
+                    writer.write(json.dumps({"error": f"{type(error).__name__}: {error}"}).encode() + b"\n")
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                writer.write(json.dumps(await self._respond(line)).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass  # Client went away
+        finally:
+            writer.close()
+
+    async def serve(self, path: Optional[str] = None, host: str = "127.0.0.1", port: int = 8848):
+        # Listen on the Unix socket at path if given, else on host:port.
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path, limit=1 << 24)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=1 << 24)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def request_samples(query: str, k: int, predicates: Optional[Dict[str, Tuple[int, int]]] = None,
+                    seed: Optional[int] = None, path: Optional[str] = None,
+                    host: str = "127.0.0.1", port: int = 8848) -> Dict:
+    """Blocking client: send one request to a SamplingService and return its response."""
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+    else:
+        connection = socket.create_connection((host, port))
+    with connection, connection.makefile("rwb") as f:
+        f.write(json.dumps({"query": query, "k": k, "predicates": predicates, "seed": seed}).encode() + b"\n")
+        f.flush()
+        return json.loads(f.readline())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve join samples over a socket.")
+    parser.add_argument("--query", nargs="+", action="append", required=True, metavar=("NAME", "FILE"),
+                        help="query name followed by the relation files (see Relation.save) it joins")
+    parser.add_argument("--socket", help="Unix socket path; listens on --host/--port otherwise")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8848)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    queries = {}
+    for name, *paths in args.query:
+        Q = [Relation.from_file(path) for path in paths]
+        box_attributes = list(dict.fromkeys(attr for relation in Q for attr in relation.attributes))
+        queries[name] = (Q, box_attributes)
+    service = SamplingService(queries, args.workers, args.batch_size)
+    try:
+        asyncio.run(service.serve(args.socket, args.host, args.port))
+    finally:
+        service.close()
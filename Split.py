@@ -0,0 +1,163 @@
+import bisect
+import math
+from typing import Dict, List, Optional, Tuple, Set
+from Relation import Relation
+from RangeTree import RangeTree
+from Oracles import count_oracle, count_cache, median_oracle, rank_search
+from LRUCache import LRUCache
+from EdgeCover import cover_cache, optimal_edge_cover
+from Instrumentation import instrumented
+
+# AGM bounds keyed by (relation cache_keys, box, box_attributes, W), stored
+# with the relation versions they were computed at.
+agm_cache = LRUCache(maxsize=1 << 14)
+
+
+@instrumented
+def agm_bound(Q: List[Relation], box: List[Tuple[int, int]],
+              box_attributes: List[str], W: Optional[List[float]] = None) -> float:
+    # AGM_W(B) = prod |R_e(B)|^{w_e}, summed in log space. W must be a
+    # fractional edge cover of Q; when omitted the LP-optimal cover of the
+    # whole query is used, so every box of a descent shares the same W.
+    if W is None:
+        W = optimal_edge_cover(Q, box_attributes)
+    key = (tuple(relation.cache_key for relation in Q), tuple(box), tuple(box_attributes), tuple(W))
+    versions = tuple(relation.version for relation in Q)
+    entry = agm_cache.get(key)
+    if entry is not None:
+        cached_versions, agm_w_b = entry
+        # Only bounds of boxes that an update touched are recomputed.
+        if cached_versions == versions or not any(
+                relation.changed_in_box(box, box_attributes, version)
+                for relation, version in zip(Q, cached_versions)):
+            if cached_versions != versions:
+                agm_cache.put(key, (versions, agm_w_b))
+            return agm_w_b
+
+    log_agm = 0.0
+    for relation, w_e in zip(Q, W):
+        re_b = count_oracle(relation, box, box_attributes)
+        if re_b == 0:
+            log_agm = -math.inf
+            break
+        log_agm += w_e * math.log(re_b)
+    agm_w_b = math.exp(log_agm)
+    # Undo the rounding of exp/log so integral bounds (and the AGM < 2 leaf
+    # test) come out exact.
+    nearest = round(agm_w_b)
+    if math.isclose(agm_w_b, nearest, rel_tol=1e-12):
+        agm_w_b = float(nearest)
+    agm_cache.put(key, (versions, agm_w_b))
+    return agm_w_b
+
+
+def clear_caches():
+    """Drop every cached AGM bound, count and cover, and reset the hit/miss counters."""
+    agm_cache.clear()
+    count_cache.clear()
+    cover_cache.clear()
+
+
+def root_box(Q: List[Relation], box_attributes: List[str],
+             predicates: Optional[Dict[str, Tuple[int, int]]] = None) -> List[Tuple[int, int]]:
+    """Tightest box that can contain a join tuple of Q.
+
+    Each attribute is bounded by the intersection of the [min, max] ranges
+    of the relations that contain it, and by the inclusive (low, high)
+    range predicates maps it to, if any. If some relation is empty the join
+    is too, and the returned box is empty as well.
+    """
+    predicates = predicates or {}
+    unknown = set(predicates) - set(box_attributes)
+    if unknown:
+        raise ValueError(f"Predicates on attributes not in box_attributes: {sorted(unknown)}")
+    B = []
+    for attr in box_attributes:
+        low, high = predicates.get(attr, (-math.inf, math.inf))
+        for relation in Q:
+            if attr in relation.attributes:
+                if not relation.stats:
+                    return [(0, -1)] * len(box_attributes)
+                stats = relation.stats[attr]
+                low, high = max(low, stats.min), min(high, stats.max)
+        B.append((low, high))
+    return B
+
+
+def replace(box: List[Tuple[int, int]], i: int, interval: Tuple[int, int]) -> \
+List[Tuple[int, int]]:
+    new_box = box.copy()
+    new_box[i] = interval
+    return new_box
+
+
+def split_order(Q: List[Relation], box_attributes: List[str]) -> List[int]:
+    """Dimensions of box_attributes in the order split should cut them.
+
+    Attributes shared by more relations come first, since fixing them in
+    B_mid shrinks every relation that contains them. Ties go to the
+    attribute with fewer distinct values (the smallest count over the
+    relations containing it, which bounds the values a join tuple can take),
+    so heavy values are isolated in a mid slice early.
+    """
+    def cost(i: int) -> Tuple[int, int]:
+        relations = [relation for relation in Q if box_attributes[i] in relation.attributes]
+        distinct = min((relation.stats[box_attributes[i]].distinct if relation.stats else 0)
+                       for relation in relations) if relations else 0
+        return -len(relations), distinct
+
+    return sorted(range(len(box_attributes)), key=cost)
+
+
+def volume(box: List[Tuple[int, int]]) -> int:
+    # Number of integer points in box.
+    result = 1
+    for low, high in box:
+        result *= max(high - low + 1, 0)
+    return result
+
+
+@instrumented
+def split(i: int, B: List[Tuple[int, int]], Q: List[Relation], box_attributes: List[str],
+          W: Optional[List[float]] = None, order: Optional[List[int]] = None) -> \
+List[List[Tuple[int, int]]]:
+    # Splits B on dimension order[i], then B_mid on the following ones.
+    # Children whose AGM bound is 0 hold no join tuple and are left out.
+    if order is None:
+        order = split_order(Q, box_attributes)
+    C = []
+    d = order[i]
+    x_i, y_i = B[d]
+    B_agm = agm_bound(Q, B, box_attributes, W)
+
+    # Find the largest z such that AGM(B_left) <= 0.5 * AGM(B). AGM(B_left)
+    # only changes where z - 1 crosses an active value, so binary search the
+    # value ranks for the smallest v whose prefix [x_i, v] holds more than
+    # half of AGM(B); that v is z. This costs O(log n) AGM evaluations
+    # instead of one per unit of the value range.
+    def exceeds_half(v: int) -> bool:
+        return agm_bound(Q, replace(B, d, (x_i, v)), box_attributes, W) > 0.5 * B_agm
+
+    z = rank_search(Q, box_attributes[d], (x_i, y_i), exceeds_half)
+    if z is None:
+        z = y_i
+
+    # Create B_left, B_mid, B_right
+    if z - 1 >= x_i:
+        B_left = replace(B, d, (x_i, z - 1))
+        if agm_bound(Q, B_left, box_attributes, W) > 0:
+            C.append(B_left)
+
+    B_mid = replace(B, d, (z, z))
+    if agm_bound(Q, B_mid, box_attributes, W) > 0:
+        if i == len(order) - 1:
+            C.append(B_mid)
+        else:
+            C.extend(split(i + 1, B_mid, Q, box_attributes, W, order))
+
+    if z + 1 <= y_i:
+        B_right = replace(B, d, (z + 1, y_i))
+        if agm_bound(Q, B_right, box_attributes, W) > 0:
+            C.append(B_right)
+
+    return C
@@ -0,0 +1,169 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from Relation import Relation
+from Oracles import count_cache
+from Split import agm_cache
+from PreparedSampler import PreparedSampler
+import Instrumentation
+import random
+
+# Relation schemas of each query shape, over attributes A, B, C, D.
+QUERIES = {
+    "chain": [("R1", ["A", "B"]), ("R2", ["B", "C"]), ("R3", ["C", "D"])],
+    "star": [("R1", ["A", "B"]), ("R2", ["A", "C"]), ("R3", ["A", "D"])],
+    "triangle": [("R1", ["A", "B"]), ("R2", ["B", "C"]), ("R3", ["A", "C"])],
+}
+DISTRIBUTIONS = ["uniform", "zipf", "heavy"]
+
+
+def generate_column(rng: np.random.Generator, distribution: str, n: int, domain: int) -> np.ndarray:
+    if distribution == "uniform":
+        return rng.integers(0, domain, n)
+    if distribution == "zipf":
+        return np.minimum(rng.zipf(1.5, n) - 1, domain - 1)
+    if distribution == "heavy":
+        # 10% of the rows share a single heavy hitter, the rest are uniform.
+        column = rng.integers(0, domain, n)
+        column[rng.random(n) < 0.1] = 0
+        return column
+    raise ValueError(f"Unknown distribution {distribution}")
+
+
+def generate_query(query: str, distribution: str, n: int, seed: int,
+                   domain_exponent: float = 0.5) -> Tuple[List[Relation], List[str]]:
+    """Relations of the given shape with at most n distinct rows each.
+
+    Every attribute takes values in [0, n ** domain_exponent).
+    """
+    rng = np.random.default_rng(seed)
+    domain = max(4, int(n ** domain_exponent))
+    Q = []
+    for name, attributes in QUERIES[query]:
+        rows = np.stack([generate_column(rng, distribution, n, domain) for _ in attributes], axis=1)
+        rows = np.unique(rows, axis=0)  # The sampler assumes set semantics
+        Q.append(Relation.from_columns(name, attributes,
+                                       {attr: rows[:, k] for k, attr in enumerate(attributes)}))
+    box_attributes = sorted({attr for _, attributes in QUERIES[query] for attr in attributes})
+    return Q, box_attributes
+
+
+def run_case(query: str, distribution: str, n: int, num_samples: int, seed: int,
+             domain_exponent: float = 0.5, max_trials: Optional[int] = None,
+             instrument: bool = False) -> Dict:
+    """Time one (query, distribution, size) case in the current process.
+
+    Stops early, with fewer samples, once max_trials trials have run. With
+    instrument set the result also holds the ``Instrumentation`` stats.
+    """
+    Q, box_attributes = generate_query(query, distribution, n, seed, domain_exponent)
+    rng = random.Random(seed)
+    stats = Instrumentation.enable_stats() if instrument else None
+
+    start = time.perf_counter()
+    sampler = PreparedSampler(None, Q, box_attributes)
+    prepare_seconds = time.perf_counter() - start
+
+    latencies = []
+    trials = 0
+    start = last = time.perf_counter()
+    while len(latencies) < num_samples and (max_trials is None or trials < max_trials):
+        trials += 1
+        if sampler.sample(rng) is not None:
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+    total_seconds = time.perf_counter() - start
+    Instrumentation.disable_stats()
+
+    samples = len(latencies)
+    return {
+        "query": query, "distribution": distribution, "rows": n,
+        "domain_exponent": domain_exponent,
+        "relation_sizes": [len(relation) for relation in Q],
+        "samples": samples, "trials": trials,
+        "trials_per_sample": trials / samples if samples else None,
+        "samples_per_second": samples / total_seconds,
+        "prepare_seconds": prepare_seconds,
+        "latency_seconds": {f"p{p}": float(np.percentile(latencies, p)) if samples else None
+                            for p in (50, 90, 99)},
+        "count_oracle_calls": count_cache.hits + count_cache.misses,
+        "count_oracle_misses": count_cache.misses,
+        "agm_calls": agm_cache.hits + agm_cache.misses,
+        "split_tree_nodes": sampler.node_count,
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "stats": stats.as_dict() if stats is not None else None,
+    }
+
+
+def run_benchmarks(sizes: List[int], distributions: List[str], queries: List[str],
+                   num_samples: int, seed: int, domain_exponent: float = 0.5,
+                   max_trials: Optional[int] = None, instrument: bool = False) -> List[Dict]:
+    # Each case runs in a fresh interpreter so its peak memory and caches
+    # are its own.
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for query in queries:
+        for distribution in distributions:
+            for n in sizes:
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_case, (query, distribution, n, num_samples, seed,
+                                                   domain_exponent, max_trials, instrument))
+                print(f"{query:8} {distribution:8} {n:>9} rows: "
+                      f"{result['samples']:6} samples, {result['trials']:9} trials, "
+                      f"{result['samples_per_second']:10.1f} samples/s")
+                results.append(result)
+    return results
+
+
+def code_version() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline_path: str):
+    # Print the samples/s ratio of every case that also appears in the baseline.
+    with open(baseline_path) as f:
+        baseline = {(case["query"], case["distribution"], case["rows"]): case
+                    for case in json.load(f)["results"]}
+    for case in results:
+        old = baseline.get((case["query"], case["distribution"], case["rows"]))
+        if old is not None and old["samples_per_second"] > 0:
+            ratio = case["samples_per_second"] / old["samples_per_second"]
+            print(f"{case['query']:8} {case['distribution']:8} {case['rows']:>9} rows: {ratio:6.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the join sampler.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS)
+    parser.add_argument("--queries", nargs="+", choices=list(QUERIES), default=list(QUERIES))
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--max-trials", type=int, default=100000,
+                        help="stop a case after this many trials")
+    parser.add_argument("--domain-exponent", type=float, default=0.5,
+                        help="attribute values are drawn from [0, rows ** exponent)")
+    parser.add_argument("--instrument", action="store_true",
+                        help="record oracle call counts, timings and descent outcomes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier JSON output to compare samples/s against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.distributions, args.queries, args.samples,
+                             args.seed, args.domain_exponent, args.max_trials, args.instrument)
+    with open(args.output, "w") as f:
+        json.dump({"version": code_version(), "python": platform.python_version(),
+                   "numpy": np.__version__, "seed": args.seed, "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
@@ -4,35 +4,36 @@ from typing import Dict, List, Tuple, Set, Union
 from Relation import Relation
 from RangeTree import RangeTree
 from Oracles import count_oracle, median_oracle, sub_join_induced_by_box
-from Sample import join_relations, sample
-from Split import agm_bound, replace, split
+from Sample import join_size, sample
+from SampleStream import SampleWriter
+from Split import agm_bound, replace, root_box, split
 import random
+import numpy as np
 
 
 def calculate_success_probability(Q: List[Relation], box_attributes: List[str],
                                   W: List[float]) -> float:
     # Calculate OUT as the actual join output size
-    join_output = join_relations(Q, box_attributes)
-    OUT = len(join_output)
+    OUT = join_size(Q, box_attributes)
 
     # Calculate AGM_W(Q)
-    B = [(1, 100)] * len(box_attributes)  # Assuming attribute space is [1, 100]^d for simplicity
-    AGM_W_Q = agm_bound(Q, B, box_attributes)
+    B = root_box(Q, box_attributes)
+    AGM_W_Q = agm_bound(Q, B, box_attributes, W)
 
     return OUT / AGM_W_Q
 
 
 def test_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
-                            W: List[float], num_trials: int) -> float:
+                            W: List[float], num_trials: int) -> Tuple[float, np.ndarray]:
     success_count = 0
-    sample_results = []
+    sample_results = np.empty((num_trials, len(box_attributes)), dtype=np.int64)
     start_time = time.time()
 
     for _ in range(num_trials):
-        s = sample(W, Q, box_attributes)
-        if s != "failure":
+        s = sample(W, Q, box_attributes, engine="agm")  # OUT/AGM success rate
+        if s is not None:
+            sample_results[success_count] = s
             success_count += 1
-            sample_results.append(s)
 
         # Print the current testing percentage as a progress bar
         progress = (_ + 1) / num_trials
@@ -45,12 +46,12 @@ def test_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     print("\n")
     print(f"Time taken for {num_trials} trials: {end_time - start_time} seconds")
 
-    return success_count / num_trials, sample_results
+    return success_count / num_trials, sample_results[:success_count]
 
 
 def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
-                            W: List[float], num_samples: int) -> List[Dict[str, Union[List[str], Tuple[int]]]]:
-    samples = []
+                            W: List[float], num_samples: int) -> np.ndarray:
+    samples = np.empty((num_samples, len(box_attributes)), dtype=np.int64)
     sample_count = 0
     start_time = time.time()
     trail_count = 0
@@ -59,8 +60,8 @@ def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     while sample_count < num_samples:
         trail_count += 1
         result = sample(W, Q, box_attributes)
-        if result != "failure":
-            samples.append(result)
+        if result is not None:
+            samples[sample_count] = result
             sample_count += 1
 
             # Print the current testing percentage as a progress bar
@@ -77,13 +78,9 @@ def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     return samples
 
 
-def save_samples_to_file(samples: List[Dict[str, Union[List[str], Tuple[int]]]],
-                         file_path: str):
-    with open(file_path, 'w') as f:
-        f.write("A\tB\tC\n")
-        for sample in samples:
-            tuple_ = sample["tuple"]
-            f.write("\t".join(map(str, tuple_)) + "\n")
+def save_samples_to_file(samples: np.ndarray, box_attributes: List[str], file_path: str):
+    with SampleWriter(file_path, box_attributes) as writer:
+        writer.write_many(map(tuple, samples.tolist()))
 
 
 if __name__ == '__main__':
@@ -94,7 +91,7 @@ if __name__ == '__main__':
     Q = [R1, R2]
 
     box_attributes = ["A", "B", "C"]
-    W = [1.5, 1.5]  # Example fractional edge covering
+    W = None  # LP-optimal fractional edge cover, see EdgeCover.optimal_edge_cover
 
     # Example usage of count_oracle, Expected output: 3
     print("Example usage of count_oracle, Expected output: 3")
@@ -130,20 +127,19 @@ if __name__ == '__main__':
 
     # Example usage of split function
     # The split boxes should be at most 2d+1, where d is the number of attributes in Q
-    # The boxes should be disjoint and have B as their union
+    # The boxes should be disjoint and cover every join tuple in B: split cuts
+    # the shared attribute B first (see split_order) and leaves out children
+    # whose AGM bound is 0, so their union is only the part of B that can
+    # hold join tuples
     print("Example usage of split function")
-    print("The split boxes should be disjoint and have B as their union, with B = [(1, 5), (2, 6), (3, 7)]")
+    print("The split boxes should be disjoint and contain every join tuple in B = [(1, 5), (2, 6), (3, 7)]; "
+          "boxes with an AGM bound of 0 are left out")
     split_result = split(0, [(1, 5), (2, 6), (3, 7)], Q, box_attributes)
     print(f"Split result: {split_result}")
     print("\n")
     # Split result:
-    # [[(1, 2), (2, 6), (3, 7)],
-    # [(3, 3), (2, 3), (3, 7)],
-    # [(3, 3), (4, 4), (3, 4)],
-    # [(3, 3), (4, 4), (5, 5)],
-    # [(3, 3), (4, 4), (6, 7)],
-    # [(3, 3), (5, 6), (3, 7)],
-    # [(4, 5), (2, 6), (3, 7)]]
+    # [[(1, 5), (2, 5), (3, 7)],
+    # [(5, 5), (6, 6), (7, 7)]]
 
     # Example usage of sample function
     print("Example usage of sample function:")
@@ -173,6 +169,17 @@ if __name__ == '__main__':
     samples = run_sampling_algorithm(Q, box_attributes, W, num_samples)
 
     # Save samples to file
-    save_samples_to_file(samples, "data/sampled_results.txt")
+    save_samples_to_file(samples, box_attributes, "data/sampled_results.txt")
     print("Samples saved to data/sampled_results.txt")
     print("First 10 Samples in result:", samples[:10])
+
+    # Inserting a tuple that is already stored leaves the relation unchanged,
+    # so the AGM sampler keeps its set semantics and still terminates
+    # Expected output: 2 tuples in R1 and a join size of 4
+    print("Insert a tuple that R1 already holds and sample again")
+    R1_set = Relation("R1", ["A", "B"], [(1, 1), (2, 1)])
+    R2_set = Relation("R2", ["B", "C"], [(1, 5), (1, 6)])
+    R1_set.insert_many([(1, 1)])
+    print(f"R1 after the insert: {R1_set.tuples}")
+    print(f"Join size: {join_size([R1_set, R2_set], ['A', 'B', 'C'])}")
+    print(f"Sample result: {sample(W, [R1_set, R2_set], ['A', 'B', 'C'], engine='agm')}")
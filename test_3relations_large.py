@@ -4,23 +4,35 @@ from typing import Dict, List, Tuple, Set, Union
 from Relation import Relation
 from RangeTree import RangeTree
 from Oracles import count_oracle, median_oracle, sub_join_induced_by_box
-from Sample import join_relations, sample
-from Split import agm_bound, replace, split
+from Sample import join_size, sample
+from SampleStream import SampleWriter
+from JoinSizeEstimate import estimate_join_size
+from Split import agm_bound, replace, root_box, split
 import random
+import numpy as np
 
 
+def calculate_success_probability(Q: List[Relation], box_attributes: List[str],
+                                  W: List[float]) -> float:
+    OUT = join_size(Q, box_attributes)
+
+    B = root_box(Q, box_attributes)
+    AGM_W_Q = agm_bound(Q, B, box_attributes, W)
+
+    return OUT / AGM_W_Q
+
 
 def test_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
-                            W: List[float], num_trials: int) -> float:
+                            W: List[float], num_trials: int) -> Tuple[float, np.ndarray]:
     success_count = 0
-    sample_results = []
+    sample_results = np.empty((num_trials, len(box_attributes)), dtype=np.int64)
     start_time = time.time()
 
     for _ in range(num_trials):
-        s = sample(W, Q, box_attributes)
-        if s != "failure":
+        s = sample(W, Q, box_attributes, engine="agm")  # OUT/AGM success rate
+        if s is not None:
+            sample_results[success_count] = s
             success_count += 1
-            sample_results.append(s)
 
         # Print the current testing percentage as a progress bar
         progress = (_ + 1) / num_trials
@@ -33,12 +45,12 @@ def test_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     print("\n")
     print(f"Time taken for {num_trials} trials: {end_time - start_time} seconds")
 
-    return success_count / num_trials, sample_results
+    return success_count / num_trials, sample_results[:success_count]
 
 
 def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
-                            W: List[float], num_samples: int) -> List[Dict[str, Union[List[str], Tuple[int]]]]:
-    samples = []
+                            W: List[float], num_samples: int) -> np.ndarray:
+    samples = np.empty((num_samples, len(box_attributes)), dtype=np.int64)
     sample_count = 0
     start_time = time.time()
     trail_count = 0
@@ -47,8 +59,8 @@ def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     while sample_count < num_samples:
         trail_count += 1
         result = sample(W, Q, box_attributes)
-        if result != "failure":
-            samples.append(result)
+        if result is not None:
+            samples[sample_count] = result
             sample_count += 1
 
             # Print the current testing percentage as a progress bar
@@ -65,13 +77,9 @@ def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     return samples
 
 
-def save_samples_to_file(samples: List[Dict[str, Union[List[str], Tuple[int]]]],
-                         file_path: str):
-    with open(file_path, 'w') as f:
-        f.write("A\tB\tC\tD\n")
-        for sample in samples:
-            tuple_ = sample["tuple"]
-            f.write("\t".join(map(str, tuple_)) + "\n")
+def save_samples_to_file(samples: np.ndarray, box_attributes: List[str], file_path: str):
+    with SampleWriter(file_path, box_attributes) as writer:
+        writer.write_many(map(tuple, samples.tolist()))
 
 
 def generate_unique_random_data(num_tuples: int, value_range: Tuple[int, int]) -> List[Tuple[int, int]]:
@@ -125,7 +133,19 @@ if __name__ == '__main__':
     Q = [R3, R4, R5]
 
     box_attributes = ["A", "B", "C", "D"]
-    W = [1.5, 1, 1.5]
+    W = None  # LP-optimal fractional edge cover, see EdgeCover.optimal_edge_cover
+
+    # Calculate theoretical success probability
+    print("Calculate theoretical success probability...")
+    theoretical_prob = calculate_success_probability(Q, box_attributes, W)
+    print(f"Theoretical success probability: {theoretical_prob}")
+
+    # Estimate the join size from sampling trials
+    estimate = estimate_join_size(Q, box_attributes, W, relative_error=0.05, time_limit=5)
+    print(f"Estimated join size: {estimate.estimate:.0f} "
+          f"(95% CI [{estimate.low:.0f}, {estimate.high:.0f}], {estimate.trials} trials), "
+          f"exact: {join_size(Q, box_attributes)}")
+    print("\n")
 
     # Test the sampling algorithm with 1000 trials
     print("Testing the sampling algorithm with 1000 trials...")
@@ -146,7 +166,7 @@ if __name__ == '__main__':
     samples = run_sampling_algorithm(Q, box_attributes, W, num_samples)
 
     # Save samples to file
-    save_samples_to_file(samples, "data/sampled_results.txt")
+    save_samples_to_file(samples, box_attributes, "data/sampled_results.txt")
     print("Samples saved to data/sampled_results.txt")
     print("First 10 Samples in result:", samples[:10])
 
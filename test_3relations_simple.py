@@ -5,23 +5,25 @@ from Relation import Relation
 from RangeTree import RangeTree
 from Oracles import count_oracle, median_oracle, sub_join_induced_by_box
 from Sample import join_relations, sample
+from SampleStream import SampleWriter
 from Split import agm_bound, replace, split
 import random
+import numpy as np
 
 
 
 def test_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
-                            W: List[float], num_trials: int) -> float:
+                            W: List[float], num_trials: int) -> Tuple[float, np.ndarray]:
     success_count = 0
-    sample_results = []
+    sample_results = np.empty((num_trials, len(box_attributes)), dtype=np.int64)
     start_time = time.time()
 
     for _ in range(num_trials):
         # print(_)
-        s = sample(W, Q, box_attributes)
-        if s != "failure":
+        s = sample(W, Q, box_attributes, engine="agm")  # OUT/AGM success rate
+        if s is not None:
+            sample_results[success_count] = s
             success_count += 1
-            sample_results.append(s)
 
         # Print the current testing percentage as a progress bar
         progress = (_ + 1) / num_trials
@@ -35,12 +37,12 @@ def test_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     print(
         f"Time taken for {num_trials} trials: {end_time - start_time} seconds")
 
-    return success_count / num_trials, sample_results
+    return success_count / num_trials, sample_results[:success_count]
 
 
 def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
-                            W: List[float], num_samples: int) -> List[Dict[str, Union[List[str], Tuple[int]]]]:
-    samples = []
+                            W: List[float], num_samples: int) -> np.ndarray:
+    samples = np.empty((num_samples, len(box_attributes)), dtype=np.int64)
     sample_count = 0
     start_time = time.time()
     trail_count = 0
@@ -49,8 +51,8 @@ def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     while sample_count < num_samples:
         trail_count += 1
         result = sample(W, Q, box_attributes)
-        if result != "failure":
-            samples.append(result)
+        if result is not None:
+            samples[sample_count] = result
             sample_count += 1
 
             # Print the current testing percentage as a progress bar
@@ -67,13 +69,9 @@ def run_sampling_algorithm(Q: List[Relation], box_attributes: List[str],
     return samples
 
 
-def save_samples_to_file(samples: List[Dict[str, Union[List[str], Tuple[int]]]],
-                         file_path: str):
-    with open(file_path, 'w') as f:
-        f.write("A\tB\tC\tD\n")
-        for sample in samples:
-            tuple_ = sample["tuple"]
-            f.write("\t".join(map(str, tuple_)) + "\n")
+def save_samples_to_file(samples: np.ndarray, box_attributes: List[str], file_path: str):
+    with SampleWriter(file_path, box_attributes) as writer:
+        writer.write_many(map(tuple, samples.tolist()))
 
 
 
@@ -89,7 +87,7 @@ if __name__ == '__main__':
 
     # Define the box_attributes and W as given in the example
     box_attributes = ["A", "B", "C", "D"]
-    W = [1.5, 1, 1.5]  # Example fractional edge covering
+    W = None  # LP-optimal fractional edge cover, see EdgeCover.optimal_edge_cover
 
     # Test the sampling algorithm with 1000 trials
     print("Testing the sampling algorithm with 1000 trials...")
@@ -107,7 +105,7 @@ if __name__ == '__main__':
     samples = run_sampling_algorithm(Q, box_attributes, W, num_samples)
 
     # Save samples to file
-    save_samples_to_file(samples, "data/sampled_results.txt")
+    save_samples_to_file(samples, box_attributes, "data/sampled_results.txt")
     print("Samples saved to data/sampled_results.txt")
     print("First 10 Samples in result:", samples[:10])
 